@@ -1,12 +1,33 @@
-import re
-import requests
+import copy
 import json
 import os
+import threading
+import time
+import queue
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+import requests
 from dotenv import load_dotenv
+from cassette import Cassette
+from cost_engine import CATEGORIES, CostEngine
+from destination_index import destination_index
+from hedging import hedged_call, latency_tracker
+from http_pool import post_with_retry
+from json_extract import extract_json, extract_json_report, apply_schema, JSONExtractionError, REQUIRED
+from llm_cache import LLMCache, cache_key
+from locations import CITIES
+from query_parser import comparison_intent, parse_locally, prefix_city, record_path, MIN_CONFIDENCE
+from prompts import SUMMARY_DAY_FIELDS, build, build_fitted, compact_json, project
+from rate_limit import get_limiter
+from router import SIMPLE_PLAN_DAYS, SIMPLE_QUERY_CHARS, SIMPLE_SUMMARY_DAYS, known_city, model_router, ModelRouter
+from single_flight import SingleFlight
+from telemetry import bind, current_span, get_logger, lazy, preview, span, traced
+from tokens import estimate_tokens
 
 load_dotenv()
 
-DEBUG = True  # Toggle this to False to hide prints
+# Console output: LOG_LEVEL=INFO for agent progress, DEBUG for prompts and outputs
+log = get_logger("agents")
 
 # =============================
 # 🔐 API KEYS & ENDPOINTS
@@ -14,14 +35,59 @@ DEBUG = True  # Toggle this to False to hide prints
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-COHERE_API_URL = "https://api.cohere.ai/v2/chat"
+# Overridable to point at a local stand-in (see stub_llm.py)
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+COHERE_API_URL = os.getenv("COHERE_API_URL", "https://api.cohere.ai/v2/chat")
+
+# Max simultaneous in-flight requests per provider (override via env)
+PROVIDER_CONCURRENCY = {
+    "groq": int(os.getenv("GROQ_MAX_CONCURRENCY", "3")),
+    "cohere": int(os.getenv("COHERE_MAX_CONCURRENCY", "3")),
+}
+_provider_slots = {p: threading.BoundedSemaphore(n) for p, n in PROVIDER_CONCURRENCY.items()}
+
+
+def set_provider_concurrency(provider, limit):
+    # Only affects calls that start after this; in-flight calls keep their old slot
+    PROVIDER_CONCURRENCY[provider] = limit
+    _provider_slots[provider] = threading.BoundedSemaphore(limit)
+
+
+# Shared on-disk response cache (None when LLM_CACHE=0)
+llm_cache = LLMCache.from_env()
+
+# Record/replay of provider responses (None unless LLM_CASSETTE=record|replay).
+# While recording, cache reads are skipped so every response really comes from the provider.
+cassette = Cassette.from_env()
+
+# Identical requests already in flight are joined instead of sent again
+llm_flights = SingleFlight("llm")
+pipeline_flights = SingleFlight("pipeline")
+
+
+def flight_label(provider, model, prompt):
+    # Readable per-key name for the single-flight counters
+    return f"{provider}:{model} {' '.join(prompt.split())[:80]}"
 
 
 # =============================
 # 🧠 GENERIC LLM CALLS
 # =============================
-def call_groq(prompt, model="llama-3.3-70b-versatile", temperature=0.3, max_tokens=1200):
+# qwen3 models answer without a reasoning preamble (which would eat the output
+# budget) when the prompt ends with /no_think; other models would read it as text
+NO_THINK_MODELS = ("qwen/qwen3",)
+
+
+def model_prompt(model, prompt):
+    # Model-specific directives, added once the routed (or hedged) model is known
+    return f"{prompt} /no_think" if model.startswith(NO_THINK_MODELS) else prompt
+
+
+def call_groq(prompt, model="llama-3.3-70b-versatile", temperature=0.3, max_tokens=1200, coalesce=True,
+              validate=None, on_send=None):
+    # validate(text) -> bool: replies it rejects are returned but never cached.
+    # on_send() fires when the request actually goes out (see post_with_retry)
+    prompt = model_prompt(model, prompt)
     headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
     payload = {
         "model": model,
@@ -29,20 +95,58 @@ def call_groq(prompt, model="llama-3.3-70b-versatile", temperature=0.3, max_toke
         "temperature": temperature,
         "max_tokens": max_tokens
     }
-    if DEBUG:
-        print(f"\n🧩 [Groq Model: {model}] Prompt:\n{prompt[:600]}...\n")
+    with span("llm.call", provider="groq", model=model, prompt_tokens=estimate_tokens(prompt)) as s:
+        if cassette and cassette.replaying:
+            s.set(source="cassette")
+            result = cassette.replay("groq", model, prompt, temperature, max_tokens, slot=_provider_slots["groq"],
+                                     on_send=on_send)
+            s.set(completion_tokens=estimate_tokens(result))
+            return result
+        if llm_cache and not cassette:
+            cached = llm_cache.get("groq", model, prompt, temperature, max_tokens)
+            if cached is not None:
+                log.debug("💾 [Groq Cache Hit: %s] %.80s", model, prompt)
+                s.set(source="cache", completion_tokens=estimate_tokens(cached))
+                return cached
 
-    r = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
-    if r.status_code != 200:
-        raise Exception(f"Groq API error: {r.status_code}, {r.text}")
-    
-    result = r.json()["choices"][0]["message"]["content"]
-    if DEBUG:
-        print(f"🔹 [Groq Output]: {result[:1000]}...\n")
-    return result
+        def fetch():
+            log.debug("🧩 [Groq Model: %s] Prompt:\n%.600s", model, prompt)
+            s.set(source="provider")
 
+            try:
+                r = post_with_retry("groq", GROQ_API_URL, headers, payload, timeout=30, slot=_provider_slots["groq"],
+                                    limiter=get_limiter("groq", model), tokens=estimate_tokens(prompt) + max_tokens,
+                                    on_send=on_send)
+            except requests.RequestException:
+                latency_tracker.record_error("groq", model)
+                raise
+            if r.status_code != 200:
+                latency_tracker.record_error("groq", model)
+                raise Exception(f"Groq API error: {r.status_code}, {r.text}")
+            latency = r.latency
+            latency_tracker.record("groq", model, latency)
+
+            result = r.json()["choices"][0]["message"]["content"]
+            log.debug("🔹 [Groq Output]: %.1000s", result)
+            if llm_cache and (validate is None or validate(result)):
+                llm_cache.set("groq", model, prompt, temperature, max_tokens, result)
+            if cassette:
+                cassette.record("groq", model, prompt, temperature, max_tokens, result, latency)
+            return result
 
-def call_cohere(prompt, model="command-a-03-2025", temperature=0.7, max_tokens=500):
+        if not coalesce:
+            result = fetch()
+        else:
+            # Stays "shared" unless this caller ends up sending the request itself
+            s.set(source="shared")
+            result = llm_flights.do(cache_key("groq", model, prompt, temperature, max_tokens), fetch,
+                                    label=flight_label("groq", model, prompt))
+        s.set(completion_tokens=estimate_tokens(result))
+        return result
+
+
+def call_cohere(prompt, model="command-a-03-2025", temperature=0.7, max_tokens=500, coalesce=True,
+                validate=None, on_send=None):
     headers = {"Authorization": f"Bearer {COHERE_API_KEY}", "Content-Type": "application/json"}
     payload = {
         "model": model,
@@ -51,238 +155,1091 @@ def call_cohere(prompt, model="command-a-03-2025", temperature=0.7, max_tokens=5
         "temperature": temperature
     }
 
-    if DEBUG:
-        print(f"\n🧩 [Cohere Model: {model}] Prompt:\n{prompt[:600]}...\n")
+    with span("llm.call", provider="cohere", model=model, prompt_tokens=estimate_tokens(prompt)) as s:
+        if cassette and cassette.replaying:
+            s.set(source="cassette")
+            result = cassette.replay("cohere", model, prompt, temperature, max_tokens,
+                                     slot=_provider_slots["cohere"], on_send=on_send)
+            s.set(completion_tokens=estimate_tokens(result))
+            return result
+        if llm_cache and not cassette:
+            cached = llm_cache.get("cohere", model, prompt, temperature, max_tokens)
+            if cached is not None:
+                log.debug("💾 [Cohere Cache Hit: %s] %.80s", model, prompt)
+                s.set(source="cache", completion_tokens=estimate_tokens(cached))
+                return cached
 
-    r = requests.post(COHERE_API_URL, headers=headers, json=payload, timeout=60)
-    if r.status_code != 200:
-        raise Exception(f"Cohere API error: {r.status_code}, {r.text}")
+        def fetch():
+            log.debug("🧩 [Cohere Model: %s] Prompt:\n%.600s", model, prompt)
+            s.set(source="provider")
 
-    response = r.json()
-    try:
-        result = response["message"]["content"][0]["text"]
-        if DEBUG:
-            print(f"🔹 [Cohere Output]: {result[:1000]}...\n")
+            try:
+                r = post_with_retry("cohere", COHERE_API_URL, headers, payload, timeout=60,
+                                    slot=_provider_slots["cohere"], limiter=get_limiter("cohere", model),
+                                    tokens=estimate_tokens(prompt) + max_tokens, on_send=on_send)
+            except requests.RequestException:
+                latency_tracker.record_error("cohere", model)
+                raise
+            if r.status_code != 200:
+                latency_tracker.record_error("cohere", model)
+                raise Exception(f"Cohere API error: {r.status_code}, {r.text}")
+            latency = r.latency
+            latency_tracker.record("cohere", model, latency)
+
+            response = r.json()
+            try:
+                result = response["message"]["content"][0]["text"]
+            except Exception as e:
+                raise Exception(f"Unexpected Cohere response: {json.dumps(response, indent=2)}") from e
+            log.debug("🔹 [Cohere Output]: %.1000s", result)
+            if llm_cache and (validate is None or validate(result)):
+                llm_cache.set("cohere", model, prompt, temperature, max_tokens, result)
+            if cassette:
+                cassette.record("cohere", model, prompt, temperature, max_tokens, result, latency)
+            return result
+
+        if not coalesce:
+            result = fetch()
+        else:
+            s.set(source="shared")
+            result = llm_flights.do(cache_key("cohere", model, prompt, temperature, max_tokens), fetch,
+                                    label=flight_label("cohere", model, prompt))
+        s.set(completion_tokens=estimate_tokens(result))
         return result
-    except Exception as e:
-        raise Exception(f"Unexpected Cohere response: {json.dumps(response, indent=2)}") from e
+
+
+LLM_CALLS = {"groq": call_groq, "cohere": call_cohere}
+
+
+def call_llm(provider, model, prompt, validate=None, **kwargs):
+    # Hedged entry point used by the agents: a slow or failing call is
+    # duplicated to an equivalent model (see hedging.py)
+    return hedged_call(LLM_CALLS, provider, model, prompt, validate=validate, **kwargs)
+
+
+def looks_like_json(is_array=False):
+    def validate(text):
+        try:
+            extract_json_report(text, is_array=is_array)
+            return True
+        except JSONExtractionError:
+            return False
+    return validate
 
 
 # =============================
-# 🧩 UTILITY: Extract JSON
+# 🌊 STREAMING LLM CALLS
 # =============================
-def extract_json(text, is_array=False):
-    text = re.sub(r'```(?:json)?', '', text)
-    text = text.strip()
-    pattern = r'\[.*\]' if is_array else r'\{.*\}'
-    match = re.search(pattern, text, re.DOTALL)
-    if not match:
-        raise Exception(f"No JSON found in: {text[:300]}")
-    json_str = match.group(0)
-    json_str = re.sub(r',\s*([\]}])', r'\1', json_str)
-    json_str = json_str.replace("\n", " ").replace("\r", " ").strip()
+def iter_sse(response):
+    # Server-sent events: one "data: <json>" line per event, blank line between events
+    for raw in response.iter_lines():
+        line = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        yield json.loads(data)
+
+
+def stream_groq(prompt, model="llama-3.3-70b-versatile", temperature=0.3, max_tokens=1200, parent=None):
+    # Not the active span: the generator is suspended between chunks, possibly on other threads,
+    # so callers pass the span it belongs under as `parent`
+    s = span("llm.stream", parent=parent, activate=False, provider="groq", model=model,
+             prompt_tokens=estimate_tokens(prompt))
+    error = None
+    try:
+        yield from _stream_groq(s, prompt, model, temperature, max_tokens)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        s.finish(error)
+
+
+def _stream_groq(s, prompt, model, temperature, max_tokens):
+    prompt = model_prompt(model, prompt)
+    if cassette and cassette.replaying:
+        s.set(source="cassette")
+        yield from cassette.replay_stream("groq", model, prompt, temperature, max_tokens,
+                                          slot=_provider_slots["groq"])
+        return
+    if llm_cache and not cassette:
+        cached = llm_cache.get("groq", model, prompt, temperature, max_tokens)
+        if cached is not None:
+            s.set(source="cache", completion_tokens=estimate_tokens(cached))
+            yield cached
+            return
+
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": True
+    }
+    log.debug("🌊 [Groq Stream: %s] Prompt:\n%.600s", model, prompt)
+    s.set(source="provider")
+
+    chunks, ttft = [], None
+    start = time.perf_counter()
+    # The slot and limiter ticket are held until the body is fully read (or the consumer stops iterating)
+    r = post_with_retry("groq", GROQ_API_URL, headers, payload, timeout=30, stream=True,
+                        slot=_provider_slots["groq"], limiter=get_limiter("groq", model),
+                        tokens=estimate_tokens(prompt) + max_tokens, span=s)
+    try:
+        if r.status_code != 200:
+            raise Exception(f"Groq API error: {r.status_code}, {r.text}")
+        for event in iter_sse(r):
+            choices = event.get("choices") or [{}]
+            text = (choices[0].get("delta") or {}).get("content")
+            if text:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                    s.set(ttft=ttft)
+                chunks.append(text)
+                yield text
+    finally:
+        r.close()
+
+    result = "".join(chunks)
+    s.set(completion_tokens=estimate_tokens(result))
+    log.debug("🔹 [Groq Stream Output]: %.1000s", result)
+    # An empty stream (e.g. cut off by the provider) is not worth replaying from the cache
+    if llm_cache and result.strip():
+        llm_cache.set("groq", model, prompt, temperature, max_tokens, result)
+    if cassette:
+        cassette.record("groq", model, prompt, temperature, max_tokens, result, time.perf_counter() - start, ttft)
+
+
+def stream_cohere(prompt, model="command-a-03-2025", temperature=0.7, max_tokens=500, parent=None):
+    s = span("llm.stream", parent=parent, activate=False, provider="cohere", model=model,
+             prompt_tokens=estimate_tokens(prompt))
+    error = None
     try:
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
-        print("\n⚠️ Invalid JSON detected:\n", json_str[:500])
-        raise e
+        yield from _stream_cohere(s, prompt, model, temperature, max_tokens)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        s.finish(error)
+
+
+def _stream_cohere(s, prompt, model, temperature, max_tokens):
+    if cassette and cassette.replaying:
+        s.set(source="cassette")
+        yield from cassette.replay_stream("cohere", model, prompt, temperature, max_tokens,
+                                          slot=_provider_slots["cohere"])
+        return
+    if llm_cache and not cassette:
+        cached = llm_cache.get("cohere", model, prompt, temperature, max_tokens)
+        if cached is not None:
+            s.set(source="cache", completion_tokens=estimate_tokens(cached))
+            yield cached
+            return
+
+    headers = {"Authorization": f"Bearer {COHERE_API_KEY}", "Content-Type": "application/json"}
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": True
+    }
+    log.debug("🌊 [Cohere Stream: %s] Prompt:\n%.600s", model, prompt)
+    s.set(source="provider")
+
+    chunks, ttft = [], None
+    start = time.perf_counter()
+    r = post_with_retry("cohere", COHERE_API_URL, headers, payload, timeout=60, stream=True,
+                        slot=_provider_slots["cohere"], limiter=get_limiter("cohere", model),
+                        tokens=estimate_tokens(prompt) + max_tokens, span=s)
+    try:
+        if r.status_code != 200:
+            raise Exception(f"Cohere API error: {r.status_code}, {r.text}")
+        for event in iter_sse(r):
+            if event.get("type") == "content-delta":
+                text = event["delta"]["message"]["content"]["text"]
+                if text:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                        s.set(ttft=ttft)
+                    chunks.append(text)
+                    yield text
+            elif event.get("type") == "message-end":
+                break
+    finally:
+        r.close()
+
+    result = "".join(chunks)
+    s.set(completion_tokens=estimate_tokens(result))
+    log.debug("🔹 [Cohere Stream Output]: %.1000s", result)
+    if llm_cache and result.strip():
+        llm_cache.set("cohere", model, prompt, temperature, max_tokens, result)
+    if cassette:
+        cassette.record("cohere", model, prompt, temperature, max_tokens, result, time.perf_counter() - start, ttft)
+
+
+STREAM_CALLS = {"groq": stream_groq, "cohere": stream_cohere}
+
+
+# =============================
+# 🧩 UTILITY: JSON schemas per agent
+# =============================
+# Field -> (type, default); REQUIRED fields can't be defaulted. Parsing and
+# repair live in json_extract.py.
+# Trip length when the query gives none
+DEFAULT_DAYS = 3
+QUERY_SCHEMA = {
+    "state": (str, ""),
+    "city": (str, REQUIRED),
+    "days": (int, DEFAULT_DAYS),
+    "budget": (int, 0),
+    "style": (str, "balanced"),
+}
+DESTINATION_SCHEMA = {"name": (str, REQUIRED)}
+# Defaults mirror the example values in the baseline prompt
+BASELINE_SCHEMA = {
+    "accommodation": (int, 1500),
+    "food": (int, 800),
+    "transport": (int, 500),
+    "activities": (int, 1000),
+}
+COMBINED_PLANS_SCHEMA = {"plans": (list, REQUIRED)}
+
+
+def parse_resolved(text):
+    # A "days": 0 or negative reply is as good as no trip length
+    resolved = extract_json(text, is_array=False, schema=QUERY_SCHEMA)
+    if resolved["days"] <= 0:
+        resolved["days"] = DEFAULT_DAYS
+    return resolved
+
+
+def plan_schema(name, style, days):
+    return {"name": (str, name), "style": (str, style), "days": (int, days), "daywise": (list, REQUIRED)}
+
+
+def normalize_plan(plan, name, style, days):
+    # Keep whatever days the model produced; fill the keys later stages index directly
+    plan, _ = apply_schema(plan, plan_schema(name, style, days))
+    daywise = []
+    for i, day in enumerate(d for d in plan["daywise"] if isinstance(d, dict)):
+        day = {**day, "day": day.get("day") if isinstance(day.get("day"), int) else i + 1}
+        day.setdefault("place", "")
+        if not isinstance(day.get("activities"), list):
+            day["activities"] = []
+        daywise.append(day)
+    if not daywise:
+        raise JSONExtractionError(f"{name} plan has no usable days")
+    return {**plan, "daywise": daywise}
 
 
 # =============================
 # 🤖 AGENTS
 # =============================
 class QueryResolverAgent:
-    def __init__(self, llm="cohere"):
-        print("\n[AGENT 1: Query Resolver - Using", llm, "]")
+    def __init__(self, llm="cohere", min_confidence=MIN_CONFIDENCE, router=None):
+        log.debug("[AGENT 1: Query Resolver - Using %s]", llm)
         self.llm = llm
+        # Local parses below this confidence fall back to the LLM
+        self.min_confidence = min_confidence
+        self.router = router or model_router
 
-    def call_model(self, prompt):
-        return call_cohere(prompt, model="command-r-08-2024")
+    def call_model(self, prompt, max_tokens=500, provider="cohere", model="command-r-08-2024", is_array=False):
+        return call_llm(provider, model, prompt, validate=looks_like_json(is_array=is_array), max_tokens=max_tokens)
 
-    def resolve_query(self, query):
-        print("\n========== 🌍 QUERY RESOLVER START ==========")
-        print(f"User Query: {query}")
+    @traced("agent.resolver.parse")
+    def parse_query(self, query):
+        local, confidence = parse_locally(query)
+        if confidence >= self.min_confidence:
+            record_path("fast_path")
+            log.debug("⚡ [Local Parse, confidence %.2f]: %s", confidence, local)
+            return local
+        record_path("llm")
 
-        prompt = f"""Extract structured info from: "{query}"
-Return valid JSON: {{"state":"name","city":"name","days":3,"budget":10000,"style":"balanced"}}"""
-        content = self.call_model(prompt)
-        extracted = extract_json(content, is_array=False)
+        prompt = build("resolver", f"""Extract structured info from: "{query}"
+Return valid JSON: {{"state":"name","city":"name","days":3,"budget":10000,"style":"balanced"}}""")
+        return self.router.call("resolver", self.call_model, prompt, parse_resolved,
+                                complexity=int(len(query) > SIMPLE_QUERY_CHARS))
 
-        for key in ["budget", "days"]:
-            try:
-                extracted[key] = int(extracted[key])
-            except Exception:
-                extracted[key] = 0
+    @traced("agent.resolver.destinations")
+    def find_destinations(self, extracted, use_index=True):
+        if use_index:
+            indexed = destination_index.get_destinations(extracted['city'])
+            if indexed:
+                return [{"name": d["name"], "city": extracted['city']} for d in indexed[:5]]
 
-        dest_prompt = f"""List 5 tourist places in {extracted['city']}, {extracted['state']}.
-Return JSON array: [{{"name":"Place 1"}},{{"name":"Place 2"}}]"""
-        dest_content = call_groq(dest_prompt, model="qwen/qwen3-32b")
-        places = extract_json(dest_content, is_array=True)
+        prompt = build("destinations", f"""List 5 tourist places in {extracted['city']}, {extracted['state']}.
+Return JSON array: [{{"name":"Place 1"}},{{"name":"Place 2"}}]""")
+        places = self.router.call(
+            "destinations", lambda text, **kwargs: self.call_model(text, is_array=True, **kwargs), prompt,
+            lambda text: extract_json(text, is_array=True, schema=DESTINATION_SCHEMA),
+            complexity=int(not known_city(extracted['city'])))
+        return [{"name": p["name"], "city": extracted['city']} for p in places[:5]]
 
-        destinations = [{"name": p.get("name", "Unknown"), "city": extracted['city']} for p in places[:5]]
+    @traced("agent.resolver")
+    def resolve_query(self, query):
+        log.info("🌍 QUERY RESOLVER: %s", query)
+
+        extracted = self.parse_query(query)
+        destinations = self.find_destinations(extracted)
         result = {**extracted, "destinations": destinations}
 
-        print("✅ Parsed Query Data:\n", json.dumps(result, indent=2))
-        print("========== 🌍 QUERY RESOLVER END ==========\n")
+        log.debug("✅ Parsed Query Data: %s", lazy(preview, result))
         return result
 
 
+PLAN_STYLES = [("Relaxed", "relaxed"), ("Balanced", "balanced"), ("Packed", "packed")]
+# per_style: one LLM call per style (default)
+# combined:  one LLM call returning all styles
+# derived:   one LLM call for the Balanced plan, Relaxed/Packed derived locally
+PLANNER_MODES = ("per_style", "combined", "derived")
+
+RELAXED_MAX_ACTIVITIES = 2
+PACKED_MIN_ACTIVITIES = 6
+PACKED_FILLERS = ["Early morning walk", "Local market visit", "Street food tasting", "Evening cultural show"]
+
+
+def derive_plan(base, name, style, destinations):
+    # Deterministic pacing rules applied to a Balanced itinerary
+    spare = [d["name"] for d in destinations if d["name"] not in {day.get("place") for day in base["daywise"]}]
+    daywise = []
+    for i, day in enumerate(base["daywise"]):
+        activities = list(day.get("activities", []))
+        if style == "relaxed" and len(activities) > RELAXED_MAX_ACTIVITIES:
+            activities = activities[:RELAXED_MAX_ACTIVITIES] + ["Free time to unwind"]
+        elif style == "packed":
+            extras = [f"Visit {spare[i % len(spare)]}"] if spare else []
+            extras += [f for f in PACKED_FILLERS if f not in activities]
+            activities += extras[:max(0, PACKED_MIN_ACTIVITIES - len(activities))]
+        daywise.append({**day, "activities": activities})
+    return {**base, "name": name, "style": style, "daywise": daywise}
+
+
 class PlannerAgent:
-    def __init__(self, llm="groq"):
-        print("\n[AGENT 2: Planner - Using", llm, "]")
+    def __init__(self, llm="groq", concurrent=True, max_workers=None, mode="per_style", router=None):
+        log.debug("[AGENT 2: Planner - Using %s]", llm)
+        if mode not in PLANNER_MODES:
+            raise Exception(f"Unknown planner mode '{mode}', expected one of {PLANNER_MODES}")
         self.llm = llm
+        self.concurrent = concurrent
+        self.mode = mode
+        # Worker count only bounds this agent; the provider-wide cap is PROVIDER_CONCURRENCY
+        self.max_workers = max_workers or len(PLAN_STYLES)
+        self.failures = {}
+        self.router = router or model_router
+
+    def call_model(self, prompt, max_tokens=1200, provider="groq", model="llama-3.3-70b-versatile"):
+        return call_llm(provider, model, prompt, validate=looks_like_json(), max_tokens=max_tokens)
 
-    def call_model(self, prompt):
-        return call_groq(prompt, model="llama-3.3-70b-versatile")
+    def build_prompt(self, resolved, name, style):
+        city, days = resolved['city'], resolved['days']
+        places = [d['name'] for d in resolved['destinations'][:3]] or [city]
+        example = {"name": name, "style": style, "days": days, "daywise": [
+            {"day": 1, "place": places[0], "activities": [f"Visit {places[0]}", "Explore nearby cafes"]}]}
+        return build("planner", f"""Create a detailed {days}-day itinerary for {city}, covering key attractions like {', '.join(places)}.
+Return only valid JSON like this, with exactly {days} "daywise" entries (one per day):
+{compact_json(example)}""")
 
-    def create_itineraries(self, resolved):
-        print("\n========== 🧭 ITINERARY PLANNER START ==========")
+    def build_combined_prompt(self, resolved):
         city, days = resolved['city'], resolved['days']
-        places = [d['name'] for d in resolved['destinations'][:3]]
-        plans = []
-        for name, style in [("Relaxed","relaxed"),("Balanced","balanced"),("Packed","packed")]:
-            prompt = f"""
-Create a detailed {days}-day itinerary for {city}, covering key attractions like {', '.join(places)}.
-Return strictly valid JSON only in this format:
-
-{{
-  "name": "{name}",
-  "style": "{style}",
-  "days": {days},
-  "daywise": [
-    {{"day": 1, "place": "{places[0]}", "activities": ["Visit {places[0]}", "Explore nearby cafes"]}},
-    {{"day": 2, "place": "{places[1]}", "activities": ["Sightseeing", "Try local food"]}}
-  ]
-}}
-Make sure the itinerary has exactly {days} entries in the 'daywise' list (one per day).
-"""
-            content = self.call_model(prompt)
-            plan = extract_json(content, is_array=False)
-            if DEBUG:
-                print(f"\n🗓️ [{name} PLAN OUTPUT]:\n", json.dumps(plan, indent=2)[:800])
-            plans.append(plan)
-        print("========== 🧭 ITINERARY PLANNER END ==========\n")
+        places = [d['name'] for d in resolved['destinations'][:3]] or [city]
+        example = {"plans": [
+            {"name": name, "style": style, "days": days, "daywise": [
+                {"day": 1, "place": places[0], "activities": [f"Visit {places[0]}"]}] if i == 0 else ["..."]}
+            for i, (name, style) in enumerate(PLAN_STYLES)]}
+        return build("planner_combined", f"""Create three {days}-day itineraries for {city}, covering key attractions like {', '.join(places)}:
+Relaxed (2-3 activities per day), Balanced (4-5 per day) and Packed (6-8 per day).
+Return only valid JSON like this, with exactly {days} "daywise" entries in every plan:
+{compact_json(example)}""")
+
+    @traced("agent.planner.plan")
+    def create_plan(self, resolved, name, style):
+        days = resolved['days']
+
+        def parse(content):
+            plan = extract_json(content, is_array=False, schema=plan_schema(name, style, days))
+            return normalize_plan(plan, name, style, days)
+
+        plan = self.router.call("planner", self.call_model, self.build_prompt(resolved, name, style), parse,
+                                complexity=int(days > SIMPLE_PLAN_DAYS))
+        log.debug("🗓️ [%s PLAN OUTPUT]: %s", name, lazy(preview, plan))
+        return plan
+
+    def plan_per_style(self, resolved, on_plan):
+        outcomes = {}
+        if self.concurrent:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="planner") as pool:
+                create_plan = bind(self.create_plan)
+                futures = {pool.submit(create_plan, resolved, name, style): name for name, style in PLAN_STYLES}
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        outcomes[name] = (future.result(), None)
+                    except Exception as e:
+                        outcomes[name] = (None, e)
+                        continue
+                    if on_plan:
+                        on_plan(outcomes[name][0])
+        else:
+            for name, style in PLAN_STYLES:
+                try:
+                    outcomes[name] = (self.create_plan(resolved, name, style), None)
+                except Exception as e:
+                    outcomes[name] = (None, e)
+                    continue
+                if on_plan:
+                    on_plan(outcomes[name][0])
+        return outcomes
+
+    def plan_combined(self, resolved, on_plan):
+        data = self.router.call("planner_combined", self.call_model, self.build_combined_prompt(resolved),
+                                lambda text: extract_json(text, is_array=False, schema=COMBINED_PLANS_SCHEMA))
+        by_style = {str(p.get("style", "")).lower(): p for p in data["plans"] if isinstance(p, dict)}
+        outcomes = {}
+        for name, style in PLAN_STYLES:
+            plan = by_style.get(style)
+            if plan is None:
+                outcomes[name] = (None, Exception(f"'{style}' plan missing from combined response"))
+                continue
+            try:
+                plan = normalize_plan({**plan, "name": name, "style": style}, name, style, resolved['days'])
+            except JSONExtractionError as e:
+                outcomes[name] = (None, e)
+                continue
+            outcomes[name] = (plan, None)
+            if on_plan:
+                on_plan(plan)
+        log.debug("🗓️ [COMBINED PLAN OUTPUT]: %s", lazy(preview, data))
+        return outcomes
+
+    def plan_derived(self, resolved, on_plan):
+        base = self.create_plan(resolved, "Balanced", "balanced")
+        outcomes = {}
+        for name, style in PLAN_STYLES:
+            plan = base if style == "balanced" else derive_plan(base, name, style, resolved['destinations'])
+            outcomes[name] = (plan, None)
+            if on_plan:
+                on_plan(plan)
+        return outcomes
+
+    @traced("agent.planner")
+    def create_itineraries(self, resolved, on_plan=None, failures=None):
+        # on_plan(plan) fires as soon as each style is ready; the return value keeps style order.
+        # failures: optional dict that also receives {name: error}, for callers sharing this agent
+        log.info("🧭 ITINERARY PLANNER (%s): %s, %s days", self.mode, resolved['city'], resolved['days'])
+        planner = {"per_style": self.plan_per_style, "combined": self.plan_combined, "derived": self.plan_derived}[self.mode]
+        outcomes = planner(resolved, on_plan)
+        outcomes = [(name, *outcomes[name]) for name, _ in PLAN_STYLES]
+
+        plans = [plan for _, plan, err in outcomes if err is None]
+        self.failures = {name: str(err) for name, _, err in outcomes if err is not None}
+        if failures is not None:
+            failures.update(self.failures)
+        for name, err in self.failures.items():
+            log.warning("⚠️ [%s PLAN FAILED]: %s", name, err)
+        if not plans:
+            details = "; ".join(f"{name}: {err}" for name, err in self.failures.items())
+            raise Exception(f"All itinerary styles failed — {details}")
         return plans
 
 
 class CostAgent:
-    def __init__(self, llm="groq"):
-        print("\n[AGENT 3: Cost Estimator - Using", llm, "]")
+    def __init__(self, llm="groq", router=None):
+        log.debug("[AGENT 3: Cost Estimator - Using %s]", llm)
         self.llm = llm
+        self.router = router or model_router
 
-    def call_model(self, prompt):
-        return call_groq(prompt, model="qwen/qwen3-32b")
+    def call_model(self, prompt, max_tokens=1200, provider="groq", model="qwen/qwen3-32b"):
+        return call_llm(provider, model, prompt, validate=looks_like_json(), max_tokens=max_tokens)
 
-    def estimate_costs(self, resolved, plans):
-        print("\n========== 💰 COST ESTIMATOR START ==========")
-        city, days = resolved['city'], resolved['days']
+    @traced("agent.cost.baseline")
+    def fetch_baseline(self, city, use_index=True):
+        # Daily baseline only depends on the city, so it can run before the plans exist
+        if use_index:
+            indexed = destination_index.get_baseline(city)
+            if indexed:
+                return dict(indexed)
+        prompt = build("baseline", f"""Estimate typical daily travel costs in {city}. Return JSON:
+{{"accommodation":1500,"food":800,"transport":500,"activities":1000}}""")
+        return self.router.call("baseline", self.call_model, prompt,
+                                lambda text: extract_json(text, is_array=False, schema=BASELINE_SCHEMA),
+                                complexity=int(not known_city(city)))
 
+    def estimate_costs(self, resolved, plans):
         # Step 1: Ask LLM for daily baseline costs
-        prompt = f"""Estimate typical daily travel costs in {city}. Return JSON:
-{{"accommodation":1500,"food":800,"transport":500,"activities":1000}}"""
-        daily = extract_json(self.call_model(prompt), is_array=False)
+        daily = self.fetch_baseline(resolved['city'])
+        return self.apply_costs(resolved, plans, daily)
+
+    @traced("agent.cost")
+    def apply_costs(self, resolved, plans, daily):
+        days = resolved['days']
+        engine = CostEngine(daily, [plan["style"] for plan in plans])
 
         costed = []
 
-        # Step 2: Calculate cost plan-wise
-        for plan in plans:
-            style = plan["style"]
-            mult = {"relaxed": 0.85, "balanced": 1.0, "packed": 1.2}.get(style, 1)
-
-            # Base daily breakdown (multiplied by style intensity)
-            daily_style_cost = {
-                "accommodation": daily["accommodation"],
-                "food": daily["food"],
-                "transport": daily["transport"],
-                "activities": int(daily["activities"] * mult)
-            }
+        # Per-day costs for each plan as a (days × categories) array
+        for i, plan in enumerate(plans):
+            day_costs = engine.day_costs(i, [d["day"] for d in plan["daywise"]], days)
 
-            # Step 3: Generate per-day cost breakdowns
             daywise_with_costs = []
-            for day_item in plan["daywise"]:
-                day_num = day_item["day"]
-                # Simulate slightly varying daily costs
-                variation = 0.9 + 0.2 * (day_num / days)
-                per_day_cost = {
-                    k: int(v * variation)
-                    for k, v in daily_style_cost.items()
-                }
-                total_day_cost = sum(per_day_cost.values())
-                day_item_with_cost = {
+            for day_item, row in zip(plan["daywise"], day_costs.tolist()):
+                per_day_cost = dict(zip(CATEGORIES, row))
+                daywise_with_costs.append({
                     **day_item,
-                    "daily_cost": total_day_cost,
+                    "daily_cost": sum(row),
                     "cost_breakdown": per_day_cost
-                }
-                daywise_with_costs.append(day_item_with_cost)
-
-            # Step 4: Compute plan-level totals
-            total = sum(d["daily_cost"] for d in daywise_with_costs)
-            breakdown = {
-                "accommodation": sum(d["cost_breakdown"]["accommodation"] for d in daywise_with_costs),
-                "food": sum(d["cost_breakdown"]["food"] for d in daywise_with_costs),
-                "transport": sum(d["cost_breakdown"]["transport"] for d in daywise_with_costs),
-                "activities": sum(d["cost_breakdown"]["activities"] for d in daywise_with_costs)
-            }
+                })
+
+            breakdown = dict(zip(CATEGORIES, day_costs.sum(axis=0).tolist()))
+            total = sum(breakdown.values())
 
             plan["daywise"] = daywise_with_costs  # inject cost data into plan
 
             cost_data = {
                 "plan_name": plan["name"],
                 "estimated_cost": total,
-                "within_budget": total <= resolved['budget'],
+                # A budget of 0 means none was given, as in fan-out and the what-if panel
+                "within_budget": not resolved['budget'] or total <= resolved['budget'],
                 "breakdown": breakdown,
                 "plan": plan
             }
 
             costed.append(cost_data)
-            if DEBUG:
-                print(f"\n💸 [{plan['name']} Plan Daily & Total Costs]:\n", json.dumps(cost_data, indent=2)[:1000])
+            log.debug("💸 [%s Plan Daily & Total Costs]: %s", plan['name'], lazy(preview, cost_data, 1000))
 
-        print("========== 💰 COST ESTIMATOR END ==========\n")
         return sorted(costed, key=lambda x: x["estimated_cost"])
 
+    def what_if(self, resolved, plans, daily, budgets, day_counts=None, seasonal_factors=(1.0,), multipliers=None):
+        # Recompute totals for many scenarios from the cached baseline — no LLM calls
+        engine = CostEngine(daily, [plan["style"] for plan in plans])
+        return engine.what_if(budgets, day_counts or [resolved['days']], seasonal_factors, multipliers)
 
 
 class SummarizerAgent:
-    def __init__(self, llm="cohere"):
-        print("\n[AGENT 4: Summarizer - Using", llm, "]")
+    def __init__(self, llm="cohere", router=None):
+        log.debug("[AGENT 4: Summarizer - Using %s]", llm)
         self.llm = llm
+        self.router = router or model_router
 
-    def call_model(self, prompt):
-        return call_cohere(prompt, model="command-r-plus-08-2024")
+    def call_model(self, prompt, max_tokens=500, provider="cohere", model="command-r-plus-08-2024"):
+        return call_llm(provider, model, prompt, validate=lambda text: bool(text.strip()), max_tokens=max_tokens)
 
-    def generate_summary(self, resolved, costed):
-        print("\n========== 📝 SUMMARIZER START ==========")
+    def stream_model(self, prompt, max_tokens=500, parent=None, provider="cohere", model="command-r-plus-08-2024"):
+        return STREAM_CALLS[provider](prompt, model=model, max_tokens=max_tokens, parent=parent)
+
+    def complexity(self, resolved):
+        return int(resolved['days'] > SIMPLE_SUMMARY_DAYS)
+
+    def build_prompt(self, resolved, costed):
+        # Only what the summary talks about: places, activities and the day's total
         best = costed[0]
-        base_summary = f"""
+        daywise = project(best['plan']['daywise'], SUMMARY_DAY_FIELDS)
+
+        def render(days, omitted):
+            more = f" (+{omitted} more days)" if omitted else ""
+            return f"""Write a friendly, engaging travel summary in markdown based on this data:
 Destination: {resolved['city']}, {resolved['state']}
-Days: {resolved['days']}, Budget: ₹{resolved['budget']}
+Days: {resolved['days']}, Budget: {f"₹{resolved['budget']}" if resolved['budget'] else "not set"}
 Selected Plan: {best['plan_name']} — Total Cost: ₹{best['estimated_cost']:,}
-Itinerary: {json.dumps(best['plan']['daywise'], indent=2)}
-"""
-        prompt = f"Write a friendly, engaging travel summary in markdown based on this data:\n{base_summary}"
-        result = self.call_model(prompt)
-        print("🪄 Generated Summary (Markdown):\n", result[:1000])
-        print("========== 📝 SUMMARIZER END ==========\n")
+Itinerary: {compact_json(days)}{more}"""
+        return build_fitted("summarizer", render, daywise, verbose=best['plan']['daywise'])
+
+    @traced("agent.summarizer")
+    def generate_summary(self, resolved, costed):
+        result = self.router.call("summarizer", self.call_model, self.build_prompt(resolved, costed),
+                                  lambda text: text, complexity=self.complexity(resolved))
+        log.debug("🪄 Generated Summary (Markdown): %.1000s", result)
         return result
 
+    def stream_summary(self, resolved, costed, parent=None):
+        log.info("📝 SUMMARIZER (streaming)")
+        s = span("agent.summarizer", parent=parent, activate=False, streaming=True)
+        error = None
+        try:
+            # A stream is shown as it arrives, so it is routed once and never escalated
+            provider, model = self.router.route("summarizer", self.complexity(resolved))
+            prompt = self.build_prompt(resolved, costed)
+            yield from self.stream_model(prompt.text, max_tokens=prompt.max_tokens, parent=s,
+                                         provider=provider, model=model)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            s.finish(error)
+
+
+# =============================
+# 🕸️ STAGE GRAPH
+# =============================
+# A stage runs once all of its inputs are available and receives them as
+# positional args in declared order; independent stages run in parallel.
+Stage = namedtuple("Stage", ["name", "inputs", "fn"])
+
+
+def run_stages(stages, max_workers=4, on_complete=None):
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        missing = [i for i in s.inputs if i not in by_name]
+        if missing:
+            raise Exception(f"Stage '{s.name}' depends on unknown stage(s): {missing}")
+
+    results, timings = {}, {}
+    pending = list(stages)
+    running = {}
+    t0 = time.perf_counter()
+
+    def timed(stage, args):
+        start = time.perf_counter() - t0
+        try:
+            with span(f"stage.{stage.name}"):
+                return stage.fn(*args)
+        finally:
+            timings[stage.name] = {"start": start, "end": time.perf_counter() - t0}
+
+    timed = bind(timed)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+        while pending or running:
+            for stage in [s for s in pending if all(i in results for i in s.inputs)]:
+                pending.remove(stage)
+                args = [results[i] for i in stage.inputs]
+                running[pool.submit(timed, stage, args)] = stage
+            if not running:
+                raise Exception(f"Stage graph has a cycle: {[s.name for s in pending]}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    results[stage.name] = future.result()
+                except Exception:
+                    for f in running:
+                        f.cancel()
+                    raise
+                if on_complete:
+                    on_complete(stage.name, results[stage.name])
+
+    for name, t in timings.items():
+        t["duration"] = t["end"] - t["start"]
+    return results, {
+        "total": time.perf_counter() - t0,
+        "stages": timings,
+        "critical_path": critical_path(by_name, timings),
+    }
+
+
+def critical_path(by_name, timings):
+    # Walk back from the last stage to finish, always following the input that finished last
+    name = max(timings, key=lambda n: timings[n]["end"])
+    path = [name]
+    while by_name[name].inputs:
+        name = max(by_name[name].inputs, key=lambda n: timings[n]["end"])
+        path.append(name)
+    return path[::-1]
+
+
+def format_timings(report):
+    lines = [f"⏱️ Total: {report['total']:.2f}s — critical path: {' → '.join(report['critical_path'])}"]
+    for name, t in sorted(report["stages"].items(), key=lambda kv: kv[1]["start"]):
+        marker = "*" if name in report["critical_path"] else " "
+        lines.append(f" {marker} {name:<13} {t['start']:6.2f}s → {t['end']:6.2f}s  ({t['duration']:.2f}s)")
+    return "\n".join(lines)
+
+
+# =============================
+# 🗺️ MULTI-DESTINATION FAN-OUT
+# =============================
+# "Multiple trips under 5000 for 3 days" or "weekend getaway near Pune" name
+# no single destination. The candidates are the state's cities from
+# locations.py. Their cost baselines are fetched in parallel, and a city
+# whose cheapest style already costs more than the budget for the trip
+# length is pruned before any planning call. The cheapest survivors get one
+# itinerary each, planned concurrently, and come back ranked.
+FANOUT_MAX_PLANS = int(os.getenv("FANOUT_MAX_PLANS", "3"))
+
+
+def candidate_cities(parsed, near=False):
+    # (state, cities) to compare; with near=True the named city is the origin and is left out
+    state = parsed.get("state") or next((s for s, cities in CITIES.items() if parsed.get("city") in cities), None)
+    if state not in CITIES:
+        raise Exception(f"No candidate cities for state '{state}'")
+    origin = parsed.get("city") if near else None
+    return state, [c for c in CITIES[state] if c != origin]
+
+
+def style_totals(daily, days):
+    # Trip total per plan style from the baseline alone; exact for a plan of `days` days
+    styles = [style for _, style in PLAN_STYLES]
+    totals = CostEngine(daily, styles).what_if([0], [days])["totals"][0, 0]
+    return dict(zip(styles, totals.tolist()))
+
+
+def fitting_style(totals, budget, preferred):
+    # The requested style if it fits the budget, else the fullest one that does (totals are cheapest first)
+    fits = [style for style, total in totals.items() if not budget or total <= budget]
+    if preferred in fits:
+        return preferred
+    return fits[-1] if fits else min(totals, key=totals.get)
+
 
 # =============================
 # 🧩 ORCHESTRATOR
 # =============================
+# Events yielded by MultiAgentOrchestrator.iter_events, in pipeline order
+# (plans arrive in completion order, one event per style)
+PipelineEvent = namedtuple("PipelineEvent", ["type", "data"])
+EVENT_QUERY = "query"                  # parsed query dict
+EVENT_DESTINATIONS = "destinations"    # list of {"name", "city"}
+EVENT_BASELINE = "baseline"            # daily cost baseline per category
+EVENT_PLAN = "plan"                    # one itinerary dict
+EVENT_COSTS = "costs"                  # costed plans, cheapest first
+EVENT_SUMMARY_CHUNK = "summary_chunk"  # markdown text delta
+EVENT_DONE = "done"                    # {"summary", "timings", "plan_failures", "reused", "results"}
+
+# Query fields each stage's output depends on. When a new query matches the
+# previous run on these fields, the stage is served from that run: a budget
+# change only re-costs (locally), a day-count change re-plans but keeps the
+# destinations and cost baseline. None means "the whole resolved query".
+STAGE_DEPENDENCIES = {
+    "destinations": ("city", "state"),
+    "baseline": ("city",),
+    "plans": ("city", "state", "days"),
+    "summary": None,
+}
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
 class MultiAgentOrchestrator:
-    def __init__(self):
-        print("\n🚀 INITIALIZING MULTI-MODEL AGENT SYSTEM\n")
-        self.agent1 = QueryResolverAgent()
-        self.agent2 = PlannerAgent()
-        self.agent3 = CostAgent()
-        self.agent4 = SummarizerAgent()
-
-    def process_query(self, query):
-        print("\n============== 🌐 ORCHESTRATION START ==============\n")
-        resolved = self.agent1.resolve_query(query)
-        plans = self.agent2.create_itineraries(resolved)
-        costed = self.agent3.estimate_costs(resolved, plans)
-        summary = self.agent4.generate_summary(resolved, costed)
-        print("\n============== ✅ ORCHESTRATION COMPLETE ==============\n")
-        return summary
\ No newline at end of file
+    def __init__(self, max_workers=4, planner_mode="per_style", latency_slo=None):
+        # latency_slo: seconds per model call for this orchestrator's routing (default ROUTER_SLO)
+        log.debug("🚀 INITIALIZING MULTI-MODEL AGENT SYSTEM")
+        self.router = model_router if latency_slo is None else ModelRouter(slo=latency_slo)
+        self.agent1 = QueryResolverAgent(router=self.router)
+        self.agent2 = PlannerAgent(mode=planner_mode, router=self.router)
+        self.agent3 = CostAgent(router=self.router)
+        self.agent4 = SummarizerAgent(router=self.router)
+        self.max_workers = max_workers
+        self.last_timings = None
+
+    def reusable(self, name, fn, previous, reused, replay=None):
+        # Wraps a stage whose first input is the parsed/resolved query (see STAGE_DEPENDENCIES)
+        fields = STAGE_DEPENDENCIES[name]
+
+        def run(query_fields, *args):
+            before = (previous or {}).get("resolved")
+            if before and name in previous:
+                if fields is None:
+                    same = query_fields == before
+                else:
+                    same = all(query_fields.get(f) == before.get(f) for f in fields)
+                if same:
+                    log.info("♻️ [%s] unchanged since the previous run, reusing it", name)
+                    current_span().set(reused=True)
+                    reused.append(name)
+                    result = copy.deepcopy(previous[name])
+                    if replay:
+                        replay(result)
+                    return result
+            return fn(query_fields, *args)
+        return run
+
+    def prefetched(self, name, fn, prefetch):
+        # Serves the stage from a speculative prefetch (prefetch.py) when it was for the same city
+        if prefetch is None:
+            return fn
+
+        def run(parsed, *args):
+            result = prefetch.take(name, parsed)
+            if result is None:
+                return fn(parsed, *args)
+            log.info("🔮 [%s] served from the %s prefetch", name, prefetch.city)
+            current_span().set(prefetched=True)
+            return result
+        return run
+
+    def build_stages(self, query, include_summary=True, on_plan=None, previous=None, reused=None, failures=None,
+                     prefetch=None):
+        # previous: results of an earlier run to reuse unchanged stages from;
+        # reused: list that collects the names of stages served from it;
+        # failures: dict that collects this run's plan failures;
+        # prefetch: prefetch.Prefetch whose destinations/baseline are used if the city matches
+        reused = [] if reused is None else reused
+        failures = {} if failures is None else failures
+
+        def resolved(parsed, destinations):
+            return {**parsed, "destinations": destinations}
+
+        def replay_plans(plans):
+            failures.update(previous.get("plan_failures", {}))
+            for plan in plans if on_plan else ():
+                on_plan(plan)
+
+        stages = [
+            Stage("parsed", [], lambda: self.agent1.parse_query(query)),
+            Stage("destinations", ["parsed"], self.prefetched(
+                "destinations", self.reusable("destinations", self.agent1.find_destinations, previous, reused),
+                prefetch)),
+            Stage("baseline", ["parsed"], self.prefetched(
+                "baseline", self.reusable("baseline", lambda parsed: self.agent3.fetch_baseline(parsed["city"]),
+                                          previous, reused), prefetch)),
+            Stage("resolved", ["parsed", "destinations"], resolved),
+            Stage("plans", ["resolved"],
+                  self.reusable("plans", lambda r: self.agent2.create_itineraries(r, on_plan, failures),
+                                previous, reused, replay=replay_plans)),
+            Stage("costed", ["resolved", "plans", "baseline"], self.agent3.apply_costs),
+        ]
+        if include_summary:
+            stages.append(Stage("summary", ["resolved", "costed"],
+                                self.reusable("summary", self.agent4.generate_summary, previous, reused)))
+        return stages
+
+    def run_pipeline(self, query, previous=None, prefetch=None):
+        # Full stage results (resolved query, plans, costs, summary, ...), not just the summary.
+        # Pass the results of an earlier run as `previous` to only redo stages whose inputs changed.
+        # Callers asking for a query that is already running share that run's results.
+        key = normalize_query(query)
+        ran = []
+
+        def run():
+            ran.append(True)
+            return self._run_pipeline(query, previous, prefetch)
+
+        results = pipeline_flights.do(("results", self.agent2.mode, key), run, label=key)
+        return results if ran else copy.deepcopy(results)
+
+    def _run_pipeline(self, query, previous, prefetch=None):
+        log.info("🌐 ORCHESTRATION START: %s", query)
+        failures = {}
+        with span("pipeline", query=query, mode=self.agent2.mode):
+            stages = self.build_stages(query, previous=previous, failures=failures, prefetch=prefetch)
+            results, timings = run_stages(stages, self.max_workers)
+        results["plan_failures"] = failures
+        self.last_timings = timings
+        log.info("✅ ORCHESTRATION COMPLETE\n%s", lazy(format_timings, timings))
+        return results
+
+    def process_query(self, query, prefetch=None):
+        return self.run_pipeline(query, prefetch=prefetch)["summary"]
+
+    @traced("pipeline.fanout")
+    def wants_comparison(self, query):
+        # Whether `query` should be compared across cities rather than planned for one. Wording
+        # that only hints at suggestions is settled by resolving the query first: it is a
+        # comparison when no city resolves or the city is just the sidebar's
+        compare, _ = comparison_intent(query)
+        if compare is not None:
+            return compare
+        try:
+            city = self.agent1.parse_query(query).get("city")
+        except Exception as e:
+            log.info("🗺️ No destination resolved for %r (%s), comparing cities", query, e)
+            return True
+        return not city or city == prefix_city(query)
+
+    def compare_destinations(self, query):
+        # Ranked comparison of candidate cities for queries without a single destination
+        # (wants_comparison); see MULTI-DESTINATION FAN-OUT above. An empty
+        # ranking means every candidate was over budget: `pruned` has each one's cheapest total
+        log.info("🗺️ FAN-OUT START: %s", query)
+        t0 = time.perf_counter()
+        parsed = self.agent1.parse_query(query)
+        state, cities = candidate_cities(parsed, near=comparison_intent(query)[1])
+        resolved = {**parsed, "state": state, "days": parsed["days"] or DEFAULT_DAYS}
+        budget, failures, pruned, survivors, ranking = resolved["budget"], {}, {}, [], []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fanout") as pool:
+            fetch_baseline = bind(self.agent3.fetch_baseline)
+            futures = {pool.submit(fetch_baseline, city): city for city in cities}
+            baselines = {}
+            for future in as_completed(futures):
+                try:
+                    baselines[futures[future]] = future.result()
+                except Exception as e:
+                    failures[futures[future]] = str(e)
+
+            for city in cities:
+                if city not in baselines:
+                    continue
+                totals = style_totals(baselines[city], resolved["days"])
+                if budget and min(totals.values()) > budget:
+                    pruned[city] = min(totals.values())
+                else:
+                    survivors.append((min(totals.values()), city, totals))
+            survivors.sort(key=lambda s: s[0])
+            unplanned = [city for _, city, _ in survivors[FANOUT_MAX_PLANS:]]
+            log.info("✂️ FAN-OUT: %d candidates, %d over budget, planning %d", len(cities), len(pruned),
+                     min(len(survivors), FANOUT_MAX_PLANS))
+
+            plan_candidate = bind(self.plan_candidate)
+            futures = {pool.submit(plan_candidate, resolved, city, baselines[city],
+                                   fitting_style(totals, budget, resolved["style"])): city
+                       for _, city, totals in survivors[:FANOUT_MAX_PLANS]}
+            for future in as_completed(futures):
+                try:
+                    ranking.append(future.result())
+                except Exception as e:
+                    failures[futures[future]] = str(e)
+                    log.warning("⚠️ [%s FAN-OUT PLAN FAILED]: %s", futures[future], e)
+
+        if not ranking and not pruned:
+            details = "; ".join(f"{city}: {err}" for city, err in failures.items())
+            raise Exception(f"No candidate city in {state} could be planned — {details}")
+        ranking.sort(key=lambda r: (not r["within_budget"], r["estimated_cost"]))
+        current_span().set(candidates=len(cities), pruned=len(pruned), planned=len(futures))
+        log.info("✅ FAN-OUT COMPLETE: %s", " > ".join(r["city"] for r in ranking))
+        return {
+            "resolved": resolved,
+            "ranking": ranking,
+            "pruned": pruned,
+            "unplanned": unplanned,
+            "failures": failures,
+            "total": time.perf_counter() - t0,
+        }
+
+    def start_comparison(self, query):
+        # Background ComparisonRun; joins an identical comparison that is still running
+        key = ("compare", normalize_query(query))
+        return pipeline_flights.attach(
+            key, lambda: ComparisonRun(self, query, on_finish=lambda: pipeline_flights.finish(key)), label=key[1])
+
+    def plan_candidate(self, resolved, city, daily, style):
+        # One fan-out city: its destinations, a single itinerary in `style`, and that plan's costs
+        resolved = {**resolved, "city": city}
+        resolved["destinations"] = self.agent1.find_destinations(resolved)
+        name = next(n for n, s in PLAN_STYLES if s == style)
+        costed = self.agent3.apply_costs(resolved, [self.agent2.create_plan(resolved, name, style)], daily)[0]
+        return {"city": city, "style": style, "destinations": resolved["destinations"], **costed}
+
+    def start_run(self, query, previous=None, prefetch=None):
+        # Background PipelineRun; joins an identical query that is still running
+        key = ("events", self.agent2.mode, normalize_query(query))
+        return pipeline_flights.attach(
+            key, lambda: PipelineRun(self, query, previous, on_finish=lambda: pipeline_flights.finish(key),
+                                     prefetch=prefetch),
+            label=key[2])
+
+    def iter_events(self, query, previous=None, prefetch=None):
+        # Yields PipelineEvents as soon as each stage finishes (see EVENT_* above)
+        root = span("pipeline", activate=False, query=query, mode=self.agent2.mode, streaming=True)
+        error = None
+        try:
+            yield from self._iter_events(root, query, previous, prefetch)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            root.finish(error)
+
+    def _iter_events(self, root, query, previous, prefetch):
+        log.info("🌐 ORCHESTRATION START (events): %s", query)
+        events, reused, failures = queue.Queue(), [], {}
+        stage_events = {"parsed": EVENT_QUERY, "destinations": EVENT_DESTINATIONS,
+                        "baseline": EVENT_BASELINE, "costed": EVENT_COSTS}
+
+        def on_stage(name, result):
+            if name in stage_events:
+                events.put(PipelineEvent(stage_events[name], result))
+
+        def work():
+            try:
+                stages = self.build_stages(query, include_summary=False, previous=previous, reused=reused,
+                                           failures=failures, prefetch=prefetch,
+                                           on_plan=lambda plan: events.put(PipelineEvent(EVENT_PLAN, plan)))
+                # type None marks the end of the stage graph
+                events.put(PipelineEvent(None, run_stages(stages, self.max_workers, on_complete=on_stage)))
+            except Exception as e:
+                events.put(e)
+
+        threading.Thread(target=bind(work, parent=root), name="orchestrator", daemon=True).start()
+        while True:
+            item = events.get()
+            if isinstance(item, Exception):
+                raise item
+            if item.type is None:
+                # Kept local: a shared orchestrator may be running other queries
+                results, timings = item.data
+                self.last_timings = timings
+                break
+            yield item
+        log.info("%s", lazy(format_timings, timings))
+
+        if previous and "summary" in previous and results["resolved"] == previous.get("resolved"):
+            reused.append("summary")
+            chunks = [previous["summary"]]
+            yield PipelineEvent(EVENT_SUMMARY_CHUNK, previous["summary"])
+        else:
+            chunks = []
+            for chunk in self.agent4.stream_summary(results["resolved"], results["costed"], parent=root):
+                chunks.append(chunk)
+                yield PipelineEvent(EVENT_SUMMARY_CHUNK, chunk)
+        results["summary"] = "".join(chunks)
+        results["plan_failures"] = failures
+        log.info("✅ ORCHESTRATION COMPLETE")
+        yield PipelineEvent(EVENT_DONE, {"summary": results["summary"], "timings": timings,
+                                         "plan_failures": dict(failures),
+                                         "reused": reused, "results": results})
+
+    def stream_query(self, query):
+        # Summary text only, chunk by chunk
+        for event in self.iter_events(query):
+            if event.type == EVENT_SUMMARY_CHUNK:
+                yield event.data
+
+
+class PipelineRun:
+    # Consumes iter_events on a background thread and records every event, so a
+    # UI can re-render the run's progress at any point (e.g. after a Streamlit
+    # rerun) without the pipeline being tied to the script run that started it
+    def __init__(self, orchestrator, query, previous=None, on_finish=None, prefetch=None):
+        self.query = query
+        self.on_finish = on_finish
+        self.events = []
+        self.results = None
+        self.error = None
+        self.started = time.time()
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(orchestrator, previous, prefetch), name="pipeline-run",
+                         daemon=True).start()
+
+    def _run(self, orchestrator, previous, prefetch):
+        try:
+            for event in orchestrator.iter_events(self.query, previous=previous, prefetch=prefetch):
+                self.events.append(event)
+                if event.type == EVENT_DONE:
+                    self.results = event.data["results"]
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
+            if self.on_finish:
+                self.on_finish()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class ComparisonRun(PipelineRun):
+    # compare_destinations on a background thread. `results` is the comparison and
+    # there are no events; otherwise it is handled like a PipelineRun (e.g. in the
+    # Streamlit result store)
+    def __init__(self, orchestrator, query, on_finish=None):
+        super().__init__(orchestrator, query, on_finish=on_finish)
+
+    def _run(self, orchestrator, previous, prefetch):
+        try:
+            self.results = orchestrator.compare_destinations(self.query)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
+            if self.on_finish:
+                self.on_finish()
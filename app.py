@@ -1,5 +1,12 @@
+import numpy as np
 import streamlit as st
-from agents import MultiAgentOrchestrator
+from agents import (
+    ComparisonRun, MultiAgentOrchestrator, normalize_query, EVENT_QUERY, EVENT_DESTINATIONS, EVENT_BASELINE, EVENT_PLAN,
+    EVENT_COSTS, EVENT_SUMMARY_CHUNK, EVENT_DONE
+)
+from cost_engine import CostEngine
+from locations import STATES, CITIES
+from prefetch import Prefetcher
 
 # ============================================================================
 # PAGE CONFIGURATION
@@ -154,46 +161,14 @@ with st.sidebar:
     st.markdown("### 📍 Your Location")
     user_state = st.selectbox(
         "Select your state/region:",
-        options=[
-            "Maharashtra", "Kerala", "Goa", "Rajasthan", "Karnataka",
-            "Tamil Nadu", "Uttar Pradesh", "Delhi", "West Bengal", "Gujarat",
-            "Madhya Pradesh", "Himachal Pradesh", "Uttarakhand", "Punjab",
-            "Andhra Pradesh", "Telangana", "Haryana", "Jammu and Kashmir",
-            "Odisha", "Assam", "Bihar", "Jharkhand", "Chhattisgarh"
-        ],
+        options=STATES,
         index=0,
         help="This helps us suggest nearby destinations"
     )
     
-    cities = {
-        "Maharashtra": ["Mumbai", "Pune", "Lonavala", "Nashik", "Aurangabad", "Nagpur", "Kolhapur", "Mahabaleshwar"],
-        "Kerala": ["Kochi", "Munnar", "Alleppey", "Thiruvananthapuram", "Wayanad", "Kovalam", "Thekkady"],
-        "Goa": ["Panaji", "Baga", "Calangute", "Anjuna", "Palolem", "Margao", "Candolim"],
-        "Rajasthan": ["Jaipur", "Udaipur", "Jodhpur", "Jaisalmer", "Pushkar", "Mount Abu", "Bikaner"],
-        "Karnataka": ["Bangalore", "Mysore", "Coorg", "Hampi", "Mangalore", "Udupi", "Chikmagalur"],
-        "Tamil Nadu": ["Chennai", "Madurai", "Coimbatore", "Ooty", "Kodaikanal", "Rameswaram", "Kanyakumari"],
-        "Uttar Pradesh": ["Agra", "Varanasi", "Lucknow", "Mathura", "Vrindavan", "Allahabad", "Ayodhya"],
-        "Delhi": ["New Delhi", "Old Delhi", "Connaught Place", "Dwarka", "Hauz Khas"],
-        "West Bengal": ["Kolkata", "Darjeeling", "Siliguri", "Durgapur", "Digha", "Kalimpong"],
-        "Gujarat": ["Ahmedabad", "Surat", "Vadodara", "Dwarka", "Somnath", "Gir", "Kutch"],
-        "Madhya Pradesh": ["Bhopal", "Indore", "Ujjain", "Gwalior", "Khajuraho", "Pachmarhi"],
-        "Himachal Pradesh": ["Shimla", "Manali", "Dharamshala", "Kullu", "Kasauli", "Dalhousie", "Spiti"],
-        "Uttarakhand": ["Dehradun", "Mussoorie", "Nainital", "Rishikesh", "Haridwar", "Auli", "Jim Corbett"],
-        "Punjab": ["Amritsar", "Chandigarh", "Ludhiana", "Patiala", "Jalandhar", "Pathankot"],
-        "Andhra Pradesh": ["Visakhapatnam", "Vijayawada", "Tirupati", "Amaravati", "Araku Valley"],
-        "Telangana": ["Hyderabad", "Warangal", "Nizamabad", "Karimnagar", "Khammam"],
-        "Haryana": ["Gurgaon", "Faridabad", "Ambala", "Karnal", "Panipat", "Kurukshetra"],
-        "Jammu and Kashmir": ["Srinagar", "Gulmarg", "Pahalgam", "Jammu", "Leh", "Ladakh", "Sonamarg"],
-        "Odisha": ["Bhubaneswar", "Puri", "Konark", "Cuttack", "Chilika", "Gopalpur"],
-        "Assam": ["Guwahati", "Kaziranga", "Tezpur", "Jorhat", "Majuli", "Sivasagar"],
-        "Bihar": ["Patna", "Bodh Gaya", "Nalanda", "Rajgir", "Gaya", "Vaishali"],
-        "Jharkhand": ["Ranchi", "Jamshedpur", "Dhanbad", "Netarhat", "Deoghar"],
-        "Chhattisgarh": ["Raipur", "Bilaspur", "Bhilai", "Durg", "Jagdalpur"]
-    }
-    
     user_city = st.selectbox(
         "City:",
-        options=cities[user_state],
+        options=CITIES[user_state],
         help="Your current city for better recommendations"
     )
     
@@ -276,26 +251,279 @@ with col_btn2:
         use_container_width=True
     )
 
+# ============================================================================
+# PARTIAL RESULT RENDERING
+# ============================================================================
+def render_query(box, resolved):
+    with box:
+        st.markdown('<div class="step-header"><h3>🌍 Understanding Your Trip</h3></div>', unsafe_allow_html=True)
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("📍 Destination", resolved.get("city") or "—", delta=resolved.get("state"), delta_color="off")
+        c2.metric("📅 Days", resolved.get("days") or "—")
+        c3.metric("💰 Budget", f"₹{resolved['budget']:,}" if resolved.get("budget") else "—")
+        c4.metric("🎯 Style", str(resolved.get("style", "balanced")).title())
+
+
+def render_destinations(box, destinations):
+    with box:
+        st.markdown("**🏛️ Top attractions:** " + " • ".join(d["name"] for d in destinations))
+
+
+def render_plan(box, plan):
+    with box:
+        with st.expander(f"🗓️ {plan.get('name', 'Plan')} itinerary ({len(plan.get('daywise', []))} days)"):
+            for day in plan.get("daywise", []):
+                st.markdown(f"**Day {day.get('day')} — {day.get('place', '')}**: " + ", ".join(day.get("activities", [])))
+
+
+def render_costs(box, costed, budget):
+    with box:
+        st.markdown('<div class="step-header"><h3>💰 Cost Comparison</h3></div>', unsafe_allow_html=True)
+        st.dataframe(
+            [
+                {
+                    "Plan": c["plan_name"],
+                    "Total (₹)": c["estimated_cost"],
+                    "Within Budget": ("✅" if c["within_budget"] else "❌") if budget else "—",
+                    **{k.title(): v for k, v in c["breakdown"].items()},
+                }
+                for c in costed
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+        if budget and not any(c["within_budget"] for c in costed):
+            st.warning(f"⚠️ Every plan exceeds your ₹{budget:,} budget — the cheapest option is shown below.")
+
+
+def render_comparison(comparison):
+    resolved, ranking = comparison["resolved"], comparison["ranking"]
+    budget = resolved.get("budget", 0)
+    st.markdown('<div class="step-header"><h3>🗺️ Destination Comparison</h3></div>', unsafe_allow_html=True)
+    st.caption(f"📍 {resolved['state']} • 📅 {resolved['days']} days"
+               + (f" • 💰 ₹{budget:,}" if budget else "") + f" • ⏱️ {comparison['total']:.1f}s")
+    if ranking:
+        st.dataframe(
+            [
+                {
+                    "Rank": i + 1,
+                    "City": r["city"],
+                    "Style": r["style"].title(),
+                    "Total (₹)": r["estimated_cost"],
+                    **({"Within Budget": "✅" if r["within_budget"] else "❌",
+                        "Headroom (₹)": budget - r["estimated_cost"]} if budget else {}),
+                }
+                for i, r in enumerate(ranking)
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+    if comparison["pruned"]:
+        cheapest = min(comparison["pruned"].values())
+        st.caption("✂️ Over budget before planning: "
+                   + ", ".join(f"{city} (from ₹{total:,})" for city, total in comparison["pruned"].items()))
+        if not ranking:
+            st.warning(f"⚠️ No city in {resolved['state']} fits ₹{budget:,} for {resolved['days']} days "
+                       f"— the cheapest needs ₹{cheapest:,}.")
+    if comparison["unplanned"]:
+        st.caption("➕ Also within budget: " + ", ".join(comparison["unplanned"]))
+    for r in ranking:
+        render_plan(st.container(), {**r["plan"], "name": f"{r['city']} — {r['plan']['name']}"})
+    for city, err in comparison["failures"].items():
+        st.warning(f"⚠️ {city} could not be planned: {err}")
+
+
+@st.fragment(run_every=0.5)
+def render_comparison_in_flight(run):
+    # Polls the background comparison; a full rerun renders the ranking
+    st.info("🗺️ Comparing destinations across the state...")
+    if run.done:
+        st.rerun()
+
+
+SEASONS = {"🍂 Off-season": 0.8, "🌤️ Regular": 1.0, "🔥 Peak season": 1.3}
+
+
+@st.fragment
+def render_what_if(resolved, costed, daily):
+    # Reruns on its own when a slider moves: pure NumPy, no LLM calls
+    st.markdown('<div class="step-header"><h3>🎚️ What If?</h3></div>', unsafe_allow_html=True)
+    plans = [c["plan"] for c in costed]
+    engine = CostEngine(daily, [p["style"] for p in plans])
+    base_budget = resolved.get("budget") or sum(c["estimated_cost"] for c in costed) // len(costed)
+
+    low = max(500, base_budget // 4)
+    high = max(base_budget * 3, low + 5000)
+
+    c1, c2, c3 = st.columns(3)
+    budget = c1.slider("💰 Budget (₹)", min_value=low, max_value=high, value=min(max(base_budget, low), high), step=500)
+    days = c2.slider("📅 Days", min_value=1, max_value=max(14, resolved["days"] * 2), value=resolved["days"])
+    season = c3.selectbox("🗓️ Season", list(SEASONS), index=1)
+
+    # One call covers the chosen point plus a budget sweep for the chart
+    sweep = np.linspace(low, high, 200)
+    scenario = engine.what_if(np.append(sweep, budget), [days], [SEASONS[season]])
+    totals, feasible = scenario["totals"][0, 0], scenario["feasible"][-1, 0, 0]
+    cheapest = scenario["cheapest_feasible"][-1, 0, 0]
+
+    st.dataframe(
+        [
+            {
+                "Plan": plan["name"],
+                "Total (₹)": int(total),
+                "Within Budget": "✅" if ok else "❌",
+                "Headroom (₹)": int(budget - total),
+            }
+            for plan, total, ok in zip(plans, totals, feasible)
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+    if cheapest >= 0:
+        st.success(f"🏆 Cheapest plan that fits: **{plans[cheapest]['name']}** (₹{int(totals[cheapest]):,})")
+    else:
+        st.warning(f"⚠️ No plan fits ₹{budget:,} for {days} days — the cheapest needs ₹{int(totals.min()):,}.")
+    st.caption("Plans within budget as the budget changes")
+    st.line_chart({"Budget (₹)": sweep, "Plans within budget": scenario["feasible"][:-1, 0, 0].sum(axis=-1)},
+                  x="Budget (₹)", y="Plans within budget")
+
+
+# ============================================================================
+# SESSION RESULT STORE
+# ============================================================================
+# Every widget interaction reruns this script, so pipelines run in the
+# background (PipelineRun) and are kept per session, keyed by normalized query.
+# Reruns re-render from the recorded events instead of calling the LLMs again.
+RESULT_STORE_SIZE = 10
+
+
+@st.cache_resource
+def get_orchestrator():
+    # One orchestrator per server process, shared by every session; HTTP
+    # connections are pooled process-wide by http_pool
+    return MultiAgentOrchestrator()
+
+
+@st.cache_resource
+def get_prefetcher():
+    # Shared worker pool for every session's speculative prefetches
+    return Prefetcher(get_orchestrator())
+
+
+def refresh_prefetch(state, city):
+    # A new sidebar city starts warming that city's destinations and baseline;
+    # whatever was still pending for the previous selection is cancelled
+    current = st.session_state.get("prefetch")
+    if current and (current.state, current.city) == (state, city):
+        return current
+    if current:
+        current.cancel()
+    st.session_state["prefetch"] = get_prefetcher().start(state, city)
+    return st.session_state["prefetch"]
+
+
+def store_run(runs, key, run):
+    runs[key] = run
+    # Forget the oldest finished runs beyond the store size
+    for old in [k for k, r in runs.items() if r.done and k != key][:max(0, len(runs) - RESULT_STORE_SIZE)]:
+        del runs[old]
+
+
+def render_events(run):
+    # Replays everything the run has produced so far
+    query_box, dest_box, plans_box, costs_box = st.container(), st.container(), st.container(), st.container()
+    with plans_box:
+        st.markdown('<div class="step-header"><h3>🧭 Itinerary Options</h3></div>', unsafe_allow_html=True)
+    st.markdown('<div class="step-header"><h3>✨ Your Personalized Travel Plan</h3></div>', unsafe_allow_html=True)
+    summary_box = st.empty()
+
+    result, budget, resolved, daily, costed = "", 0, {}, None, []
+    for event in list(run.events):
+        if event.type == EVENT_QUERY:
+            resolved, budget = event.data, event.data.get("budget", 0)
+            render_query(query_box, event.data)
+        elif event.type == EVENT_DESTINATIONS:
+            render_destinations(dest_box, event.data)
+        elif event.type == EVENT_BASELINE:
+            daily = event.data
+        elif event.type == EVENT_PLAN:
+            render_plan(plans_box, event.data)
+        elif event.type == EVENT_COSTS:
+            costed = event.data
+            render_costs(costs_box, costed, budget)
+        elif event.type == EVENT_SUMMARY_CHUNK:
+            result += event.data
+        elif event.type == EVENT_DONE:
+            result = event.data["summary"]
+            if event.data["reused"]:
+                st.caption("♻️ Reused from your previous search: " + ", ".join(event.data["reused"]))
+            for name, err in event.data["plan_failures"].items():
+                plans_box.warning(f"⚠️ {name} plan could not be generated: {err}")
+    summary_box.markdown(result)
+    return result, resolved, daily, costed
+
+
+@st.fragment(run_every=0.5)
+def render_in_flight(run):
+    # Polls the background run; a full rerun renders the finished result
+    with st.spinner("🤖 Our agents are planning your trip..."):
+        render_events(run)
+    if run.done:
+        st.rerun()
+
+
 # ============================================================================
 # MAIN PIPELINE EXECUTION
 # ============================================================================
+runs = st.session_state.setdefault("pipeline_runs", {})
+prefetch = refresh_prefetch(user_state, user_city)
+
 if run_btn and query:
+    q_lower = query.lower()
+    if user_state.lower() not in q_lower and user_city.lower() not in q_lower:
+        enhanced = f"state {user_state} city {user_city} {query}"
+    else:
+        enhanced = query
+
+    key = normalize_query(enhanced)
+    if key not in runs or runs[key].error:
+        if get_orchestrator().wants_comparison(enhanced):
+            # No single destination: compare the state's cities instead of planning one
+            run = get_orchestrator().start_comparison(enhanced)
+        else:
+            # Stages whose inputs didn't change since the last search are reused, an identical
+            # query already running for another session is joined, and a prefetch for the
+            # sidebar city serves the destinations and baseline when the query is about it
+            run = get_orchestrator().start_run(enhanced, previous=st.session_state.get("last_results"),
+                                               prefetch=prefetch)
+        store_run(runs, key, run)
+    st.session_state["active_query"] = key
+
+elif run_btn:
+    st.warning("⚠️ Please enter a travel query to get started!")
+    st.info("💡 Try using one of the example queries from the sidebar, or write your own!")
+
+run = runs.get(st.session_state.get("active_query"))
+if isinstance(run, ComparisonRun):
+    if not run.done:
+        render_comparison_in_flight(run)
+    elif run.error:
+        st.error(f"❌ **Could not compare destinations:** {run.error}")
+    else:
+        render_comparison(run.results)
+elif run and not run.done:
+    render_in_flight(run)
+elif run:
     
     try:
-        orchestrator = MultiAgentOrchestrator()
-        
-        q_lower = query.lower()
-        if user_state.lower() not in q_lower and user_city.lower() not in q_lower:
-            enhanced = f"state {user_state} city {user_city} {query}"
-        else:
-            enhanced = query
-        
-        result = orchestrator.process_query(enhanced)
+        if run.error:
+            raise run.error
+        st.session_state["last_results"] = run.results
         
-        st.markdown('<div class="step-header"><h3>✨ Your Personalized Travel Plan</h3></div>', unsafe_allow_html=True)
+        result, resolved, daily, costed = render_events(run)
         
-        # Final summary display
-        st.markdown(result)
+        if daily and costed and resolved.get("days"):
+            render_what_if(resolved, costed, daily)
         
         st.markdown("---")
         
@@ -306,13 +534,15 @@ if run_btn and query:
             st.download_button(
                 label="📥 Download Full Itinerary",
                 data=result,
-                file_name=f"TripMind_{user_city}_{query.split()[0]}.txt",
+                file_name=f"TripMind_{user_city}_{(query.split() or ['Plan'])[0]}.txt",
                 mime="text/plain",
                 use_container_width=True
             )
         
         with col2:
             if st.button("🔄 Modify Query", use_container_width=True):
+                # Results stay in the store; submitting the same query again shows them instantly
+                st.session_state.pop("active_query", None)
                 st.rerun()
         
         with col3:
@@ -346,10 +576,6 @@ if run_btn and query:
         
         st.info("💡 **Tip:** Try simplifying your query or use one of the example queries from the sidebar.")
 
-elif run_btn:
-    st.warning("⚠️ Please enter a travel query to get started!")
-    st.info("💡 Try using one of the example queries from the sidebar, or write your own!")
-
 # ============================================================================
 # FOOTER
 # ============================================================================
@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import telemetry
+from agents import MultiAgentOrchestrator, PLANNER_MODES
+
+# =============================
+# 📦 BATCH ITINERARY GENERATION
+# =============================
+# Reads queries from JSONL ({"id": ..., "query": ...} or a bare JSON string
+# per line), runs them through the orchestrator with bounded concurrency and
+# appends one JSON result per line as each query finishes. The output file
+# doubles as the checkpoint: ids already written with "ok": true are
+# skipped on the next run, failed ones are retried (last record per id wins).
+
+
+def load_queries(path):
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"query": item}
+            if not item.get("query"):
+                raise Exception(f"{path}:{line_no}: missing 'query'")
+            # Stable id so resumes match even if the input is reordered
+            item.setdefault("id", hashlib.sha1(item["query"].encode("utf-8")).hexdigest()[:12])
+            queries.append(item)
+    return queries
+
+
+def load_finished(path):
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial last line from an interrupted run
+            if record.get("ok"):
+                finished.add(record["id"])
+            else:
+                finished.discard(record.get("id"))
+    return finished
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class BatchRunner:
+    def __init__(self, output, concurrency=4, planner_mode="per_style"):
+        self.output = output
+        self.concurrency = concurrency
+        self.planner_mode = planner_mode
+        self._orchestrator = None
+        self._orchestrator_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def orchestrator(self):
+        # Per-run state comes back in the results, so all workers share one orchestrator
+        with self._orchestrator_lock:
+            if self._orchestrator is None:
+                self._orchestrator = MultiAgentOrchestrator(planner_mode=self.planner_mode)
+            return self._orchestrator
+
+    def run_one(self, item):
+        start = time.perf_counter()
+        record = {"id": item["id"], "query": item["query"]}
+        try:
+            orchestrator = self.orchestrator()
+            results = orchestrator.run_pipeline(item["query"])
+            record.update({
+                "ok": True,
+                "resolved": results["resolved"],
+                "costs": [
+                    {k: c[k] for k in ("plan_name", "estimated_cost", "within_budget", "breakdown")}
+                    for c in results["costed"]
+                ],
+                "summary": results["summary"],
+                "plan_failures": results["plan_failures"],
+            })
+        except Exception as e:
+            record.update({"ok": False, "error": f"{type(e).__name__}: {e}"})
+        record["latency"] = round(time.perf_counter() - start, 3)
+        return record
+
+    def write(self, f, record):
+        with self._write_lock:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def run(self, queries):
+        finished = load_finished(self.output)
+        todo = [q for q in queries if q["id"] not in finished]
+        log(f"📦 {len(queries)} queries, {len(queries) - len(todo)} already done, {len(todo)} to run")
+
+        latencies, failed, done = [], 0, 0
+        start = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch")
+        try:
+            with open(self.output, "a", encoding="utf-8") as f:
+                futures = [pool.submit(self.run_one, q) for q in todo]
+                for future in as_completed(futures):
+                    record = future.result()
+                    self.write(f, record)
+                    done += 1
+                    latencies.append(record["latency"])
+                    if not record["ok"]:
+                        failed += 1
+                    log(f"{'✅' if record['ok'] else '❌'} [{done}/{len(todo)}] {record['id']} "
+                        f"{record['latency']:.1f}s {record.get('error', '')}")
+        except KeyboardInterrupt:
+            log("⏸️ Interrupted — finished queries are saved, re-run the same command to resume")
+            pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            pool.shutdown()
+
+        wall = time.perf_counter() - start
+        return {
+            "total": len(queries),
+            "skipped": len(queries) - len(todo),
+            "completed": done,
+            "succeeded": done - failed,
+            "failed": failed,
+            "wall_seconds": round(wall, 2),
+            "throughput_qps": round(done / wall, 3) if wall > 0 else 0.0,
+            "latency_mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_p99": percentile(latencies, 99),
+            "latency_max": max(latencies, default=0.0),
+        }
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate travel plans for a JSONL file of queries")
+    parser.add_argument("input", help="JSONL file with one query per line")
+    parser.add_argument("output", help="JSONL results file (appended to; also the resume checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Queries processed at once")
+    parser.add_argument("--planner-mode", default="per_style", choices=PLANNER_MODES)
+    parser.add_argument("--verbose", action="store_true", help="Log the agents' progress")
+    parser.add_argument("--report", help="Also write the final report as JSON to this file")
+    parser.add_argument("--metrics", help="Trace the run and write Prometheus metrics to this file")
+    args = parser.parse_args()
+
+    if args.verbose:
+        telemetry.set_log_level("INFO")
+    if args.metrics:
+        telemetry.enable()
+    runner = BatchRunner(args.output, concurrency=args.concurrency, planner_mode=args.planner_mode)
+    report = runner.run(load_queries(args.input))
+
+    log("\n📊 Batch report")
+    for key, value in report.items():
+        log(f"  {key:<15} {value}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(telemetry.render_prometheus())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import agents
+import rate_limit
+import single_flight
+import stub_llm
+from agents import MultiAgentOrchestrator, PLANNER_MODES
+from batch import log, percentile
+from destination_index import DestinationIndex
+
+# =============================
+# 🏎️ END-TO-END PIPELINE BENCHMARK
+# =============================
+# Drives MultiAgentOrchestrator against the local stub LLM server (stub_llm.py),
+# so runs are free and repeatable:
+#   python bench_pipeline.py                                  # print a report
+#   python bench_pipeline.py --save-baseline bench_baseline.json
+#   python bench_pipeline.py --baseline bench_baseline.json   # exit 1 on regressions
+# Response cache, destination index and request coalescing are off and the
+# RPM/TPM budgets are lifted (unless --real-limits) so every query does the
+# full amount of work; the per-provider concurrency caps stay as configured.
+DEFAULT_QUERIES = [
+    "Mumbai 3 days budget 8000",
+    "Jaipur 4 days budget 15000",
+    "Munnar 2 days budget 6000",
+    "Goa 5 days budget 20000",
+]
+# Metrics compared against a baseline; True when higher is better
+BASELINE_METRICS = {"p50": False, "p95": False, "p99": False, "qps": True}
+
+
+def latency_summary(values):
+    return {
+        "n": len(values),
+        "mean": round(statistics.mean(values), 4) if values else 0.0,
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+    }
+
+
+def configure(args):
+    agents.llm_cache = None
+    agents.destination_index = DestinationIndex(path=os.path.join(tempfile.mkdtemp(), "empty.sqlite3"))
+    single_flight.SINGLE_FLIGHT_ENABLED = args.coalesce
+    if not args.real_limits:
+        for limits in rate_limit.DEFAULT_LIMITS.values():
+            limits.update(rpm=0, tpm=0)
+    if args.groq_url and args.cohere_url:
+        agents.GROQ_API_URL, agents.COHERE_API_URL = args.groq_url, args.cohere_url
+        return None
+    stub = stub_llm.start_in_thread(args.stub_port, stub_llm.load_config(args.stub_config), args.seed)
+    urls = stub_llm.urls(args.stub_port)
+    agents.GROQ_API_URL, agents.COHERE_API_URL = urls["groq"], urls["cohere"]
+    return stub
+
+
+def bench_stages(orchestrator, queries, repeat):
+    # Sequential runs: per-stage durations without queueing effects
+    stages, totals, errors = {}, [], 0
+    for _ in range(repeat):
+        for query in queries:
+            try:
+                orchestrator.run_pipeline(query)
+            except Exception as e:
+                errors += 1
+                log(f"❌ {query}: {e}")
+                continue
+            timings = orchestrator.last_timings
+            totals.append(timings["total"])
+            for name, t in timings["stages"].items():
+                stages.setdefault(name, []).append(t["duration"])
+    return {
+        "end_to_end": latency_summary(totals),
+        "stages": {name: latency_summary(values) for name, values in stages.items()},
+        "errors": errors,
+    }
+
+
+def bench_concurrency(orchestrator, queries, level, per_worker):
+    def run_one(query):
+        start = time.perf_counter()
+        try:
+            orchestrator.run_pipeline(query)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    work = [queries[i % len(queries)] for i in range(level * per_worker)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=level, thread_name_prefix="bench") as pool:
+        outcomes = list(pool.map(run_one, work))
+    wall = time.perf_counter() - start
+    latencies = [latency for latency, error in outcomes if error is None]
+    return {
+        **latency_summary(latencies),
+        "errors": len(outcomes) - len(latencies),
+        "wall_seconds": round(wall, 3),
+        "qps": round(len(latencies) / wall, 3) if wall > 0 else 0.0,
+    }
+
+
+def flatten(report):
+    # {"stages.plans.p95": 1.2, "concurrency.16.qps": 3.4, ...} for baseline comparison
+    metrics = {}
+    for name, summary in report["stages"].items():
+        metrics.update({f"stages.{name}.{k}": v for k, v in summary.items() if k in BASELINE_METRICS})
+    metrics.update({f"end_to_end.{k}": v for k, v in report["end_to_end"].items() if k in BASELINE_METRICS})
+    for level, summary in report["concurrency"].items():
+        metrics.update({f"concurrency.{level}.{k}": v for k, v in summary.items() if k in BASELINE_METRICS})
+    return metrics
+
+
+def compare(report, baseline, tolerance, min_delta):
+    # A metric regresses when it is worse by more than `tolerance` (relative) and `min_delta` (absolute)
+    current, before = flatten(report), flatten(baseline)
+    rows = []
+    for key in sorted(current.keys() & before.keys()):
+        now, then = current[key], before[key]
+        higher_is_better = BASELINE_METRICS[key.rsplit(".", 1)[1]]
+        worse = then - now if higher_is_better else now - then
+        regressed = worse > min_delta and then > 0 and worse / then > tolerance
+        rows.append({"metric": key, "baseline": then, "current": now,
+                     "change": round((now - then) / then, 3) if then else None, "regressed": regressed})
+    return rows
+
+
+def print_report(report):
+    log(f"\n{'stage':<14} {'n':>4} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, s in list(report["stages"].items()) + [("END TO END", report["end_to_end"])]:
+        log(f"{name:<14} {s['n']:>4} {s['mean']:>8.3f} {s['p50']:>8.3f} {s['p95']:>8.3f} {s['p99']:>8.3f}")
+    log(f"\n{'concurrency':<12} {'qps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>6}")
+    for level, s in report["concurrency"].items():
+        log(f"{level:<12} {s['qps']:>8.3f} {s['p50']:>8.3f} {s['p95']:>8.3f} {s['p99']:>8.3f} {s['errors']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark against a stub LLM server")
+    parser.add_argument("--queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--repeat", type=int, default=3, help="Sequential runs per query for stage latencies")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 4, 16])
+    parser.add_argument("--per-worker", type=int, default=4, help="Queries per concurrent worker")
+    parser.add_argument("--planner-mode", default="per_style", choices=PLANNER_MODES)
+    parser.add_argument("--stub-port", type=int, default=8901)
+    parser.add_argument("--stub-config", help="JSON overrides for stub_llm.DEFAULT_CONFIG")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--groq-url", help="Use an already running server instead of starting the stub")
+    parser.add_argument("--cohere-url")
+    parser.add_argument("--coalesce", action="store_true", help="Keep single-flight request coalescing on")
+    parser.add_argument("--real-limits", action="store_true", help="Keep the RPM/TPM budgets")
+    parser.add_argument("--json", help="Write the full report to this file")
+    parser.add_argument("--save-baseline", help="Store this run as the baseline")
+    parser.add_argument("--baseline", help="Compare against a stored baseline; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="Ignore absolute changes below this")
+    args = parser.parse_args()
+
+    stub = configure(args)
+    orchestrator = MultiAgentOrchestrator(planner_mode=args.planner_mode)
+    log(f"🏎️ Stage latencies: {len(args.queries)} queries × {args.repeat}")
+    report = bench_stages(orchestrator, args.queries, args.repeat)
+    report["concurrency"] = {}
+    for level in args.concurrency:
+        log(f"🏎️ Concurrency {level}: {level * args.per_worker} queries")
+        report["concurrency"][str(level)] = bench_concurrency(orchestrator, args.queries, level, args.per_worker)
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("json", "save_baseline", "baseline")}
+    if stub:
+        report["stub"] = dict(stub.stats)
+
+    print_report(report)
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    if not args.baseline:
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        rows = compare(report, json.load(f), args.tolerance, args.min_delta)
+    regressions = [r for r in rows if r["regressed"]]
+    log(f"\n📐 Baseline comparison ({len(rows)} metrics, tolerance {args.tolerance:.0%})")
+    for r in rows:
+        change = f"{r['change']:+.1%}" if r["change"] is not None else "n/a"
+        log(f"{'❌' if r['regressed'] else '  '} {r['metric']:<32} {r['baseline']:>9.3f} → {r['current']:>9.3f} ({change})")
+    if regressions:
+        log(f"\n{len(regressions)} regression(s)")
+        sys.exit(1)
+    log("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
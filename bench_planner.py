@@ -0,0 +1,115 @@
+import argparse
+import json
+import statistics
+import time
+
+import agents
+from agents import PlannerAgent, QueryResolverAgent, PLANNER_MODES, PLAN_STYLES
+from tokens import estimate_tokens
+
+# =============================
+# 📏 PLANNER MODE BENCHMARK
+# =============================
+# Compares per_style / combined / derived planning on the same resolved
+# queries: LLM calls, estimated prompt/completion tokens, latency and a few
+# structural quality checks. Makes real LLM calls (response cache disabled).
+DEFAULT_QUERIES = [
+    "Mumbai 3 days budget 8000",
+    "Jaipur 4 days budget 15000",
+    "Munnar 2 days budget 6000",
+]
+
+
+def measure_quality(plans, resolved):
+    # Structural checks only: right day count, requested places covered, pacing ordered by style
+    places = [d["name"].lower() for d in resolved["destinations"][:3]]
+    by_style = {p.get("style"): p for p in plans}
+    day_ok = sum(len(p.get("daywise", [])) == resolved["days"] for p in plans)
+    text = json.dumps(plans).lower()
+    coverage = sum(place in text for place in places) / len(places) if places else 0.0
+    pace = {
+        style: statistics.mean(len(d.get("activities", [])) for d in p["daywise"]) if p.get("daywise") else 0
+        for style, p in by_style.items()
+    }
+    ordered = all(s in pace for _, s in PLAN_STYLES) and pace["relaxed"] <= pace["balanced"] <= pace["packed"]
+    return {
+        "styles": len(by_style),
+        "day_count_ok": day_ok,
+        "place_coverage": round(coverage, 2),
+        "activities_per_day": {k: round(v, 1) for k, v in pace.items()},
+        "pacing_ordered": ordered,
+    }
+
+
+def run_mode(mode, resolved):
+    planner = PlannerAgent(mode=mode)
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    call_model = planner.call_model
+
+    def counted(prompt, **kwargs):
+        output = call_model(prompt, **kwargs)
+        usage["calls"] += 1
+        usage["prompt_tokens"] += estimate_tokens(prompt)
+        usage["completion_tokens"] += estimate_tokens(output)
+        return output
+
+    planner.call_model = counted
+    start = time.perf_counter()
+    try:
+        plans = planner.create_itineraries(resolved)
+        error = None
+    except Exception as e:
+        plans, error = [], str(e)
+    usage["latency"] = time.perf_counter() - start
+    usage["quality"] = measure_quality(plans, resolved) if plans else None
+    usage["failures"] = dict(planner.failures) if not error else {"all": error}
+    return usage
+
+
+def summarize(runs):
+    latencies = [r["latency"] for r in runs]
+    return {
+        "runs": len(runs),
+        "calls": statistics.mean(r["calls"] for r in runs),
+        "prompt_tokens": statistics.mean(r["prompt_tokens"] for r in runs),
+        "completion_tokens": statistics.mean(r["completion_tokens"] for r in runs),
+        "latency_mean": statistics.mean(latencies),
+        "latency_max": max(latencies),
+        "failed_runs": sum(1 for r in runs if r["failures"]),
+        "day_count_ok": sum(r["quality"]["day_count_ok"] for r in runs if r["quality"]),
+        "place_coverage": statistics.mean(r["quality"]["place_coverage"] for r in runs if r["quality"]) if any(r["quality"] for r in runs) else 0,
+        "pacing_ordered": sum(1 for r in runs if r["quality"] and r["quality"]["pacing_ordered"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PlannerAgent modes")
+    parser.add_argument("--queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--modes", nargs="*", default=list(PLANNER_MODES), choices=PLANNER_MODES)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--json", help="Write the full report to this file")
+    args = parser.parse_args()
+
+    agents.llm_cache = None  # every run must hit the provider
+    resolver = QueryResolverAgent()
+    resolved_queries = [resolver.resolve_query(q) for q in args.queries]
+
+    report = {}
+    for mode in args.modes:
+        runs = [run_mode(mode, resolved) for resolved in resolved_queries for _ in range(args.repeat)]
+        report[mode] = {"summary": summarize(runs), "runs": runs}
+
+    print(f"\n{'mode':<10} {'calls':>5} {'prompt tok':>10} {'compl tok':>9} {'mean s':>7} {'max s':>6} "
+          f"{'fail':>4} {'days ok':>7} {'coverage':>8} {'paced':>5}")
+    for mode, data in report.items():
+        s = data["summary"]
+        print(f"{mode:<10} {s['calls']:>5.1f} {s['prompt_tokens']:>10.0f} {s['completion_tokens']:>9.0f} "
+              f"{s['latency_mean']:>7.2f} {s['latency_max']:>6.2f} {s['failed_runs']:>4} "
+              f"{s['day_count_ok']:>7} {s['place_coverage']:>8.2f} {s['pacing_ordered']:>5}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import atexit
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+from llm_cache import cache_key
+
+# =============================
+# 📼 RECORD / REPLAY CASSETTES
+# =============================
+# LLM_CASSETTE=record saves every provider response (text, latency and, for
+# streams, time to first chunk) to a gzipped JSONL cassette as it arrives.
+# LLM_CASSETTE=replay serves them back offline with the observed latency
+# times LLM_CASSETTE_LATENCY_SCALE (0 = instant), holding the provider slot
+# meanwhile so concurrency behaves as it did live. Requests are matched on
+# the response-cache key; repeated recordings of one request replay in turn.
+# A request missing from the cassette raises CassetteMiss.
+DEFAULT_PATH = "llm_cassette.jsonl.gz"
+STREAM_CHUNK_WORDS = 4
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+class Cassette:
+    def __init__(self, path=DEFAULT_PATH, mode="replay", latency_scale=1.0):
+        if mode not in ("record", "replay"):
+            raise Exception(f"Cassette mode must be 'record' or 'replay', got '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._entries = defaultdict(list)
+        self._next = Counter()
+        self._file = None
+        if mode == "replay":
+            for entry in read_entries(path):
+                self._entries[entry["key"]].append(entry)
+        else:
+            atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls):
+        mode = os.getenv("LLM_CASSETTE", "off").lower()
+        if mode in ("", "0", "off", "false", "no"):
+            return None
+        return cls(
+            path=os.getenv("LLM_CASSETTE_PATH", DEFAULT_PATH),
+            mode=mode,
+            latency_scale=float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "1.0")),
+        )
+
+    @property
+    def recording(self):
+        return self.mode == "record"
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def record(self, provider, model, prompt, temperature, max_tokens, text, latency, ttft=None):
+        if not self.recording:
+            return
+        entry = {
+            "key": cache_key(provider, model, prompt, temperature, max_tokens),
+            "provider": provider,
+            "model": model,
+            "latency": round(latency, 4),
+            "text": text,
+        }
+        if ttft is not None:
+            entry["ttft"] = round(ttft, 4)
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                # Appending adds a gzip member; readers see one continuous stream
+                self._file = gzip.open(self.path, "at", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            self.stats["recorded"] += 1
+
+    def lookup(self, provider, model, prompt, temperature, max_tokens):
+        key = cache_key(provider, model, prompt, temperature, max_tokens)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.stats["misses"] += 1
+                raise CassetteMiss(f"No {provider}:{model} recording for prompt: {prompt[:120]!r}")
+            entry = entries[self._next[key] % len(entries)]
+            self._next[key] += 1
+            self.stats["replayed"] += 1
+        return entry
+
+    def replay(self, provider, model, prompt, temperature, max_tokens, slot=None, on_send=None):
+        entry = self.lookup(provider, model, prompt, temperature, max_tokens)
+        with slot or nullcontext():
+            if on_send:
+                on_send()
+            time.sleep(entry["latency"] * self.latency_scale)
+        return entry["text"]
+
+    def replay_stream(self, provider, model, prompt, temperature, max_tokens, slot=None):
+        entry = self.lookup(provider, model, prompt, temperature, max_tokens)
+        words = entry["text"].split(" ")
+        chunks = [" ".join(words[i:i + STREAM_CHUNK_WORDS]) + " " for i in range(0, len(words), STREAM_CHUNK_WORDS)]
+        chunks[-1] = chunks[-1][:-1]
+        ttft = entry.get("ttft", entry["latency"])
+        # The rest of the recorded latency is spread evenly across the chunks
+        gap = max(0.0, entry["latency"] - ttft) / len(chunks) * self.latency_scale
+        with slot or nullcontext():
+            time.sleep(ttft * self.latency_scale)
+            for i, chunk in enumerate(chunks):
+                if i:
+                    time.sleep(gap)
+                yield chunk
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_entries(path):
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                entries.append(json.loads(line))
+        except (EOFError, json.JSONDecodeError):
+            pass  # truncated tail from an interrupted recording
+    return entries
+
+
+def summarize(path):
+    entries = read_entries(path)
+    by_model = defaultdict(list)
+    for entry in entries:
+        by_model[f"{entry['provider']}:{entry['model']}"].append(entry["latency"])
+    return {
+        "path": path,
+        "bytes": os.path.getsize(path) if os.path.exists(path) else 0,
+        "entries": len(entries),
+        "unique_requests": len({e["key"] for e in entries}),
+        "models": {
+            model: {"entries": len(lat), "latency_mean": round(sum(lat) / len(lat), 3), "latency_max": max(lat)}
+            for model, lat in by_model.items()
+        },
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(summarize(sys.argv[1] if len(sys.argv) > 1 else os.getenv("LLM_CASSETTE_PATH", DEFAULT_PATH)),
+                     indent=2))
@@ -0,0 +1,82 @@
+import numpy as np
+
+# =============================
+# 🧮 VECTORIZED COST ENGINE
+# =============================
+# Costs are arrays over (plan, day, category). Per-day costs follow the
+# CostAgent model: activities scale with the plan style, every category is
+# scaled by a day-dependent variation 0.9 + 0.2 * (day / days), and values
+# are truncated to whole rupees at the same points as the original loop.
+# what_if() broadcasts that model over budgets × seasons × trip lengths ×
+# plans in one call, with no LLM involvement.
+CATEGORIES = ("accommodation", "food", "transport", "activities")
+STYLE_MULTIPLIERS = {"relaxed": 0.85, "balanced": 1.0, "packed": 1.2}
+# Which categories the style multiplier applies to (and are truncated before day variation)
+STYLE_SCALED = np.array([False, False, False, True])
+
+
+def style_matrix(styles, multipliers=None):
+    # (P, C) per-category multipliers; unknown styles cost like "balanced"
+    multipliers = multipliers or STYLE_MULTIPLIERS
+    mult = np.array([multipliers.get(s, 1.0) for s in styles], dtype=float)
+    return np.where(STYLE_SCALED, mult[:, None], 1.0)
+
+
+def variation(day_numbers, days):
+    if days <= 0:
+        raise Exception(f"Trip length must be positive, got {days}")
+    return 0.9 + 0.2 * (np.asarray(day_numbers, dtype=float) / days)
+
+
+class CostEngine:
+    def __init__(self, baseline, styles, multipliers=None):
+        self.baseline = np.array([baseline[c] for c in CATEGORIES], dtype=float)
+        self.styles = list(styles)
+        self.style_mult = style_matrix(self.styles, multipliers)
+
+    def style_daily(self, seasonal=1.0, style_mult=None):
+        # (..., P, C) daily cost per plan before day variation
+        seasonal = np.asarray(seasonal, dtype=float)[..., None, None]
+        style_mult = self.style_mult if style_mult is None else style_mult
+        daily = self.baseline * seasonal * style_mult
+        return np.where(STYLE_SCALED, np.floor(daily), daily)
+
+    def day_costs(self, plan_index, day_numbers, days):
+        # (D, C) integer costs for one plan's days
+        daily = self.style_daily()[plan_index]
+        return np.floor(daily[None, :] * variation(day_numbers, days)[:, None]).astype(np.int64)
+
+    def what_if(self, budgets, day_counts, seasonal_factors=(1.0,), multipliers=None):
+        budgets = np.asarray(budgets, dtype=float)
+        day_counts = np.asarray(day_counts, dtype=int)
+        seasonal_factors = np.asarray(seasonal_factors, dtype=float)
+
+        if day_counts.min() <= 0:
+            raise Exception(f"Trip lengths must be positive, got {day_counts.tolist()}")
+        max_days = int(day_counts.max())
+        day_nums = np.arange(1, max_days + 1)
+        # (N, Dmax) variation per trip length, zeroed past each length
+        var = 0.9 + 0.2 * (day_nums[None, :] / day_counts[:, None])
+        var = np.where(day_nums[None, :] <= day_counts[:, None], var, 0.0)
+
+        style_mult = style_matrix(self.styles, multipliers) if multipliers else None
+        daily = self.style_daily(seasonal_factors, style_mult)  # (S, P, C)
+        # (S, N, P, Dmax, C) -> sum over days
+        per_day = np.floor(daily[:, None, :, None, :] * var[None, :, None, :, None])
+        breakdown = per_day.sum(axis=3).astype(np.int64)  # (S, N, P, C)
+        totals = breakdown.sum(axis=-1)  # (S, N, P)
+
+        feasible = totals[None, ...] <= budgets[:, None, None, None]  # (B, S, N, P)
+        masked = np.where(feasible, totals[None, ...], np.iinfo(np.int64).max)
+        cheapest_feasible = np.where(feasible.any(axis=-1), masked.argmin(axis=-1), -1)
+        return {
+            "styles": self.styles,
+            "budgets": budgets,
+            "day_counts": day_counts,
+            "seasonal_factors": seasonal_factors,
+            "totals": totals,
+            "breakdown": breakdown,
+            "feasible": feasible,
+            "cheapest": totals.argmin(axis=-1),  # (S, N)
+            "cheapest_feasible": cheapest_feasible,  # (B, S, N), -1 when nothing fits
+        }
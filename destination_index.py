@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from locations import CITIES
+
+# =============================
+# 🗂️ OFFLINE DESTINATION & COST INDEX
+# =============================
+# Precomputed top attractions and daily cost baselines for every sidebar
+# city, so the common path skips two LLM round trips. Built/refreshed with:
+#   python destination_index.py build      # every city
+#   python destination_index.py refresh    # only missing or older than MAX_AGE_DAYS
+#   python destination_index.py status
+# Schedule `refresh` (e.g. weekly cron) to keep entries current. Readers load
+# the whole table into memory once (~150 rows) and reload when the file changes.
+INDEX_PATH = os.getenv("DESTINATION_INDEX_PATH", "destination_index.sqlite3")
+MAX_AGE_DAYS = float(os.getenv("DESTINATION_INDEX_MAX_AGE_DAYS", "30"))
+# Entries past MAX_AGE_DAYS are still served until this multiple, then ignored
+STALE_GRACE = 2.0
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS cities (
+    city_key TEXT PRIMARY KEY,
+    city TEXT NOT NULL,
+    state TEXT NOT NULL,
+    destinations TEXT,
+    baseline TEXT,
+    updated_at REAL NOT NULL)"""
+
+
+def _city_key(city):
+    return (city or "").strip().lower()
+
+
+class DestinationIndex:
+    def __init__(self, path=INDEX_PATH, max_age_days=MAX_AGE_DAYS):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self._rows = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute(_SCHEMA)
+        return closing(conn)
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return {}
+        with self._lock:
+            if mtime != self._mtime:
+                with self._connect() as conn:
+                    rows = conn.execute(
+                        "SELECT city_key, city, state, destinations, baseline, updated_at FROM cities").fetchall()
+                self._rows = {
+                    key: {
+                        "city": city,
+                        "state": state,
+                        "destinations": json.loads(dest) if dest else None,
+                        "baseline": json.loads(base) if base else None,
+                        "updated_at": updated,
+                    }
+                    for key, city, state, dest, base, updated in rows
+                }
+                self._mtime = mtime
+            return self._rows
+
+    def _fresh(self, city, field):
+        row = self._load().get(_city_key(city))
+        usable = row and row[field] and time.time() - row["updated_at"] <= self.max_age * STALE_GRACE
+        with self._lock:
+            self.stats[f"{field}_{'hits' if usable else 'misses'}"] += 1
+        return row[field] if usable else None
+
+    def get_destinations(self, city):
+        return self._fresh(city, "destinations")
+
+    def get_baseline(self, city):
+        return self._fresh(city, "baseline")
+
+    def put(self, city, state, destinations=None, baseline=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO cities(city_key, city, state, destinations, baseline, updated_at) "
+                "VALUES(?, ?, ?, ?, ?, ?) ON CONFLICT(city_key) DO UPDATE SET "
+                "destinations = COALESCE(excluded.destinations, destinations), "
+                "baseline = COALESCE(excluded.baseline, baseline), updated_at = excluded.updated_at",
+                (_city_key(city), city, state,
+                 json.dumps(destinations, separators=(",", ":")) if destinations else None,
+                 json.dumps(baseline, separators=(",", ":")) if baseline else None,
+                 time.time()))
+
+    def stale_cities(self):
+        rows = self._load()
+        now = time.time()
+        return [
+            (city, state)
+            for state, cities in CITIES.items()
+            for city in cities
+            if _city_key(city) not in rows
+            or not rows[_city_key(city)]["destinations"]
+            or not rows[_city_key(city)]["baseline"]
+            or now - rows[_city_key(city)]["updated_at"] > self.max_age
+        ]
+
+    def status(self):
+        rows = self._load()
+        total = sum(len(c) for c in CITIES.values())
+        return {
+            "path": self.path,
+            "cities_indexed": len(rows),
+            "cities_known": total,
+            "stale_or_missing": len(self.stale_cities()),
+            "max_age_days": self.max_age / 86400,
+            **dict(self.stats),
+        }
+
+
+destination_index = DestinationIndex()
+
+
+def build(index, cities, concurrency=4):
+    # Imported here: agents reads from this module, the build writes via the agents
+    import agents
+
+    # The index is built once and reused for every query, so it always gets the largest models
+    router = agents.ModelRouter(enabled=False)
+    resolver, cost_agent = agents.QueryResolverAgent(router=router), agents.CostAgent(router=router)
+
+    def build_one(city, state):
+        destinations = resolver.find_destinations({"city": city, "state": state}, use_index=False)
+        baseline = cost_agent.fetch_baseline(city, use_index=False)
+        index.put(city, state, destinations=destinations, baseline=baseline)
+        return city
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="index") as pool:
+        futures = {pool.submit(build_one, city, state): city for city, state in cities}
+        for done, future in enumerate(as_completed(futures), 1):
+            city = futures[future]
+            try:
+                future.result()
+                print(f"✅ [{done}/{len(futures)}] {city}")
+            except Exception as e:
+                failures[city] = str(e)
+                print(f"❌ [{done}/{len(futures)}] {city}: {e}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline destination & cost index")
+    parser.add_argument("command", choices=["build", "refresh", "status"])
+    parser.add_argument("--state", help="Only (re)build cities in this state")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    index = destination_index
+    if args.command == "status":
+        print(json.dumps(index.status(), indent=2))
+        return
+    if args.command == "build":
+        targets = [(city, state) for state, cities in CITIES.items() for city in cities]
+    else:
+        targets = index.stale_cities()
+    if args.state:
+        targets = [(city, state) for city, state in targets if state == args.state]
+    print(f"🗂️ Indexing {len(targets)} cities into {index.path}")
+    failures = build(index, targets, concurrency=args.concurrency)
+    print(f"Done: {len(targets) - len(failures)} indexed, {len(failures)} failed")
+
+
+if __name__ == "__main__":
+    main()
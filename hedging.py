@@ -0,0 +1,191 @@
+import bisect
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from telemetry import bind, current_span, get_logger
+
+# =============================
+# 🏁 HEDGED REQUESTS & FAILOVER
+# =============================
+# If a call hasn't returned by the model's observed latency percentile, a
+# duplicate goes to an equivalent model (on the other provider by default)
+# and the first valid answer wins. Errors fail over immediately. Python
+# threads can't abort a blocking HTTP read, so the losing request is left to
+# finish in the background and its result is discarded. The deadline runs
+# from when the primary request is actually sent: time spent queued behind
+# the rate limiter or waiting for a connection slot doesn't count.
+HEDGING_ENABLED = os.getenv("LLM_HEDGING", "1").lower() not in ("0", "false", "off", "no")
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# "cross": hedge to the equivalent model on the other provider; "same": duplicate the call
+HEDGE_MODE = os.getenv("LLM_HEDGE_MODE", "cross")
+
+# Deadlines used until a model has HEDGE_MIN_SAMPLES observations
+DEFAULT_DEADLINES = {"groq": 8.0, "cohere": 15.0}
+MIN_DEADLINE = 1.0
+
+EQUIVALENT_MODELS = {
+    ("groq", "llama-3.3-70b-versatile"): ("cohere", "command-a-03-2025"),
+    ("groq", "qwen/qwen3-32b"): ("cohere", "command-r-08-2024"),
+    ("groq", "llama-3.1-8b-instant"): ("cohere", "command-r-08-2024"),
+    ("cohere", "command-r-08-2024"): ("groq", "llama-3.1-8b-instant"),
+    ("cohere", "command-r-plus-08-2024"): ("groq", "llama-3.3-70b-versatile"),
+    ("cohere", "command-a-03-2025"): ("groq", "llama-3.3-70b-versatile"),
+}
+
+# Log-spaced bucket upper bounds in seconds (50ms .. ~100s)
+BUCKETS = [0.05 * (1.25 ** i) for i in range(35)]
+
+log = get_logger("hedging")
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "32")), thread_name_prefix="hedge")
+
+
+class InvalidResponse(Exception):
+    # The model answered, but validate() rejected the text
+    pass
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0
+        self.errors = 0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += 1
+
+    def percentile(self, pct):
+        if not self.total:
+            return None
+        target = self.total * pct / 100.0
+        running = 0
+        for i, count in enumerate(self.counts):
+            running += count
+            if running >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1] * 1.25
+        return BUCKETS[-1]
+
+
+class LatencyTracker:
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, provider, model):
+        key = (provider, model)
+        if key not in self._histograms:
+            self._histograms[key] = LatencyHistogram()
+        return self._histograms[key]
+
+    def record(self, provider, model, seconds):
+        with self._lock:
+            self._histogram(provider, model).record(seconds)
+
+    def record_error(self, provider, model):
+        with self._lock:
+            self._histogram(provider, model).errors += 1
+
+    def percentile(self, provider, model, pct):
+        with self._lock:
+            return self._histogram(provider, model).percentile(pct)
+
+    def health(self, provider, model):
+        # (responses + errors seen, error rate)
+        with self._lock:
+            hist = self._histogram(provider, model)
+            seen = hist.total + hist.errors
+            return seen, (hist.errors / seen if seen else 0.0)
+
+    def deadline(self, provider, model):
+        with self._lock:
+            hist = self._histogram(provider, model)
+            if hist.total < HEDGE_MIN_SAMPLES:
+                return DEFAULT_DEADLINES.get(provider, 10.0)
+            return max(MIN_DEADLINE, hist.percentile(HEDGE_PERCENTILE))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                f"{p}:{m}": {
+                    "samples": h.total,
+                    "errors": h.errors,
+                    "p50": h.percentile(50),
+                    "p95": h.percentile(95),
+                    "p99": h.percentile(99),
+                }
+                for (p, m), h in self._histograms.items()
+            }
+
+
+latency_tracker = LatencyTracker()
+hedge_stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0}
+_stats_lock = threading.Lock()
+
+
+def _bump(name):
+    with _stats_lock:
+        hedge_stats[name] += 1
+
+
+def backup_target(provider, model):
+    if HEDGE_MODE == "same":
+        return provider, model
+    return EQUIVALENT_MODELS.get((provider, model), (provider, model))
+
+
+def hedged_call(calls, provider, model, prompt, validate=None, **kwargs):
+    # calls: {"groq": call_groq, "cohere": call_cohere}; validate(text) -> bool is also
+    # passed down so the call only caches replies that pass it
+    def attempt(p, m, **extra):
+        result = calls[p](prompt, model=m, validate=validate, **kwargs, **extra)
+        if validate and not validate(result):
+            raise InvalidResponse(f"Invalid response from {p}:{m}: {result[:200]}")
+        return result
+
+    _bump("calls")
+    if not HEDGING_ENABLED:
+        return attempt(provider, model)
+
+    sent = threading.Event()
+    primary = _pool.submit(bind(attempt), provider, model, on_send=sent.set)
+    # Cache hits and calls joined to one already in flight never send and aren't hedged
+    primary.add_done_callback(lambda _: sent.set())
+    sent.wait()
+    done, _ = wait([primary], timeout=latency_tracker.deadline(provider, model))
+    if done and primary.exception() is None:
+        return primary.result()
+
+    if done:
+        _bump("failovers")
+        current_span().set(failover=True)
+        log.warning("🛟 [%s:%s failed: %s] failing over", provider, model, primary.exception())
+    else:
+        _bump("hedged")
+        current_span().set(hedged=True)
+        log.info("🏁 [%s:%s slower than deadline] sending hedge request", provider, model)
+    alt_provider, alt_model = backup_target(provider, model)
+    # A same-model hedge must really be a second request, not joined to the first
+    extra = {"coalesce": False} if (alt_provider, alt_model) == (provider, model) else {}
+    backup = _pool.submit(bind(attempt), alt_provider, alt_model, **extra)
+
+    pending = {primary, backup} - ({primary} if done else set())
+    errors = [primary.exception()] if done else []
+    while pending:
+        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            if future.exception() is None:
+                for loser in pending:
+                    loser.cancel()
+                if future is backup and not done:
+                    _bump("hedge_wins")
+                return future.result()
+            errors.append(future.exception())
+    raise errors[-1]
+
+
+def hedging_stats():
+    with _stats_lock:
+        stats = dict(hedge_stats)
+    return {**stats, "latency": latency_tracker.snapshot()}
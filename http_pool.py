@@ -0,0 +1,143 @@
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, nullcontext
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from telemetry import current_span, get_logger
+
+# =============================
+# 🔌 POOLED HTTP SESSIONS
+# =============================
+# One keep-alive session per provider so repeated calls reuse TCP+TLS
+# connections. urllib3's connection pool is thread-safe; the session is
+# only used for plain POSTs and never has its headers/cookies mutated.
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "20"))
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+log = get_logger("http")
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+retry_counts = Counter()
+_retry_lock = threading.Lock()
+
+
+def get_session(provider):
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = requests.Session()
+            # Retries are handled below so Retry-After and jitter apply to every provider
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[provider] = session
+        return session
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def warm_connection(provider, url):
+    # Opens a pooled keep-alive connection (TCP+TLS) ahead of the first real call.
+    # Any response will do, so a HEAD on the chat endpoint is enough.
+    try:
+        get_session(provider).head(url, timeout=(CONNECT_TIMEOUT, CONNECT_TIMEOUT)).close()
+        return True
+    except requests.RequestException as e:
+        log.info("🔌 [%s] could not warm a connection: %s", provider, e)
+        return False
+
+
+def backoff_delay(attempt):
+    # "Full jitter": uniform in [0, base * 2^attempt], capped
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def retry_after_delay(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0.0), BACKOFF_CAP)
+
+
+def release_on_close(response, held):
+    # Closing the response also exits `held` (an ExitStack)
+    close = response.close
+
+    def release():
+        try:
+            close()
+        finally:
+            held.close()
+    response.close = release
+    return response
+
+
+def post_with_retry(provider, url, headers, payload, timeout, retries=None, slot=None, stream=False,
+                    limiter=None, tokens=0, span=None, on_send=None):
+    # `slot` (e.g. a semaphore) is held only while a request is in flight,
+    # never while sleeping between attempts. `limiter` (rate_limit.RateLimiter)
+    # queues each attempt against its RPM/TPM budget and learns from the status.
+    # A successful stream=True response keeps its slot and limiter ticket until
+    # the caller closes it, so reading the body counts as in flight.
+    # Retries are counted on `span` (default: the active span). on_send() is
+    # called as each attempt goes out, once the limiter and slot let it through,
+    # and the returned response's `latency` covers that final attempt alone.
+    retries = MAX_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        held = ExitStack()
+        try:
+            ticket = held.enter_context(limiter.request(tokens)) if limiter else None
+            held.enter_context(slot or nullcontext())
+            if on_send:
+                on_send()
+            sent = time.perf_counter()
+            r = get_session(provider).post(
+                url, headers=headers, json=payload,
+                timeout=(CONNECT_TIMEOUT, timeout), stream=stream)
+            r.latency = time.perf_counter() - sent
+            retry_after = retry_after_delay(r) if r.status_code in RETRY_STATUSES else None
+            if ticket:
+                ticket.status, ticket.retry_after = r.status_code, retry_after
+            final = r.status_code not in RETRY_STATUSES or attempt == retries
+            if final and stream and r.status_code == 200:
+                return release_on_close(r, held.pop_all())
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            delay = backoff_delay(attempt)
+        else:
+            if final:
+                return r
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            r.close()
+        finally:
+            held.close()
+        with _retry_lock:
+            retry_counts[provider] += 1
+        (span or current_span()).add("retries")
+        log.warning("🔁 [%s retry %d/%d] sleeping %.2fs", provider, attempt + 1, retries, delay)
+        time.sleep(delay)
@@ -0,0 +1,267 @@
+import json
+import re
+
+from telemetry import get_logger
+
+# =============================
+# 🧩 JSON EXTRACTION & REPAIR
+# =============================
+# LLM replies wrap JSON in chatter, ``` fences and (qwen3) <think> blocks,
+# and sometimes emit single quotes, trailing commas or a truncated tail.
+# One bracket-aware pass finds every top-level {...} / [...] span, each
+# span is repaired in a second linear pass, and the candidate that best
+# matches the caller's schema wins.
+_THINK_RE = re.compile(r"<think>.*?(?:</think>|$)", re.DOTALL | re.IGNORECASE)
+_FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_NUMBER_RE = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+_CLOSERS = {"{": "}", "[": "]"}
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+log = get_logger("json")
+
+# Schema default marking a field that cannot be filled in
+REQUIRED = object()
+
+
+class JSONExtractionError(Exception):
+    pass
+
+
+def strip_noise(text):
+    return _FENCE_RE.sub("", _THINK_RE.sub("", text)).strip()
+
+
+def find_candidates(text):
+    # Yields (start, end, complete) for each top-level bracketed span.
+    # Quotes are only treated as strings inside brackets, so apostrophes in
+    # surrounding prose ("Here's your plan") don't derail the scan, and a
+    # single quote only opens a string where a key or value can begin, so
+    # bracketed prose ("[Note: it's simple]") doesn't either.
+    stack, start, quote, escape, prev = [], 0, None, False, ""
+    for i, ch in enumerate(text):
+        if quote:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == quote:
+                quote = None
+        elif ch in _CLOSERS:
+            if not stack:
+                start = i
+            stack.append(_CLOSERS[ch])
+        elif ch in "}]":
+            if ch not in stack:
+                continue  # stray closer
+            while stack.pop() != ch:
+                pass
+            if not stack:
+                yield start, i + 1, True
+        elif stack and (ch == '"' or (ch == "'" and prev in "{[,:")):
+            quote = ch
+        if not ch.isspace():
+            prev = ch
+    if stack:
+        yield start, len(text), False
+
+
+def repair(fragment):
+    # Returns (json_text, repairs) with single quotes, trailing commas,
+    # Python literals, raw control characters in strings and unclosed
+    # brackets fixed up. `safe` remembers the last point where every value
+    # so far was complete, used when a truncated tail can't be closed as-is.
+    out, stack, repairs = [], [], set()
+    quote, escape, safe = None, False, None
+    i, n = 0, len(fragment)
+    while i < n:
+        ch = fragment[i]
+        if quote:
+            if escape:
+                escape = False
+                if quote == "'" and ch == "'":
+                    out[-1] = "'"  # \' is not a valid JSON escape
+                else:
+                    out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"':
+                out.append('\\"')
+            elif ch in "\n\r\t":
+                out.append({"\n": "\\n", "\r": "\\r", "\t": "\\t"}[ch])
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in "\"'":
+            if ch == "'":
+                repairs.add("single_quotes")
+            quote = ch
+            out.append('"')
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+            out.append(ch)
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+                repairs.add("trailing_comma")
+            if ch in stack:
+                while stack:
+                    closer = stack.pop()
+                    out.append(closer)
+                    if closer == ch:
+                        break
+                    repairs.add("mismatched_bracket")
+                safe = (len(out), tuple(stack))
+            else:
+                repairs.add("stray_bracket")
+        elif ch == ",":
+            safe = (len(out), tuple(stack))
+            out.append(ch)
+        elif ch.isalpha():
+            j = i
+            while j < n and (fragment[j].isalnum() or fragment[j] == "_"):
+                j += 1
+            word = fragment[i:j]
+            if word in _LITERALS:
+                repairs.add("python_literal")
+            out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if not quote and not stack:
+        return "".join(out), repairs
+
+    repairs.add("truncated")
+    if quote:
+        out.append('"')
+    head = "".join(out).rstrip()
+    if head.endswith(","):
+        head = head[:-1]
+    elif head.endswith(":"):
+        head += " null"
+    attempt = head + "".join(reversed(stack))
+    try:
+        json.loads(attempt, strict=False)
+        return attempt, repairs
+    except json.JSONDecodeError:
+        if safe is None:
+            return attempt, repairs
+        cut, cut_stack = safe
+        return "".join(out[:cut]) + "".join(reversed(cut_stack)), repairs
+
+
+def _coerce(value, typ):
+    if typ is int:
+        if isinstance(value, bool):
+            raise ValueError
+        if isinstance(value, (int, float)):
+            return int(value)
+        match = _NUMBER_RE.search(str(value))
+        if not match:
+            raise ValueError
+        return int(float(match.group(0).replace(",", "")))
+    if typ is str:
+        if value is None or isinstance(value, (dict, list)):
+            raise ValueError
+        return str(value)
+    if typ is list:
+        if not isinstance(value, list):
+            raise ValueError
+        return value
+    return value
+
+
+def apply_schema(obj, schema, path=""):
+    # Coerces known fields in place of the original; returns (obj, missing)
+    # or raises when a REQUIRED field can't be recovered.
+    if not isinstance(obj, dict):
+        raise JSONExtractionError(f"Expected an object{' at ' + path if path else ''}, got {type(obj).__name__}")
+    result, missing = dict(obj), []
+    for field, (typ, default) in schema.items():
+        try:
+            result[field] = _coerce(obj[field], typ)
+        except (KeyError, ValueError, TypeError):
+            if default is REQUIRED:
+                raise JSONExtractionError(f"Missing required field '{path}{field}'")
+            result[field] = default() if callable(default) else default
+            missing.append(path + field)
+    return result, missing
+
+
+def _shape(value, is_array, item_schema):
+    # Unwrap the common "wrong container" mistakes: [{...}] for an object,
+    # {"places": [...]} for an array, and bare strings for single-field items.
+    if is_array and isinstance(value, dict):
+        lists = [v for v in value.values() if isinstance(v, list)]
+        if len(lists) == 1:
+            value = lists[0]
+    if not is_array and isinstance(value, list) and len(value) == 1 and isinstance(value[0], dict):
+        value = value[0]
+    if is_array and isinstance(value, list) and item_schema:
+        fields = list(item_schema)
+        if len(fields) == 1:
+            value = [{fields[0]: v} if isinstance(v, str) else v for v in value]
+    return value
+
+
+def _validate(value, is_array, schema):
+    if is_array:
+        if not isinstance(value, list):
+            raise JSONExtractionError(f"Expected a JSON array, got {type(value).__name__}")
+        if not schema:
+            return value, []
+        items, missing = [], []
+        for idx, item in enumerate(value):
+            try:
+                item, item_missing = apply_schema(item, schema, f"[{idx}].")
+            except JSONExtractionError as e:
+                missing.append(f"[{idx}] dropped ({e})")
+                continue
+            items.append(item)
+            missing += item_missing
+        if value and not items:
+            raise JSONExtractionError("No array item matched the expected schema")
+        return items, missing
+    if not isinstance(value, dict):
+        raise JSONExtractionError(f"Expected a JSON object, got {type(value).__name__}")
+    return apply_schema(value, schema) if schema else (value, [])
+
+
+def extract_json_report(text, is_array=False, schema=None):
+    # Returns (value, report); report lists repairs applied and fields
+    # filled from schema defaults.
+    cleaned = strip_noise(text)
+    best, errors = None, []
+    for start, end, _ in find_candidates(cleaned):
+        fixed, repairs = repair(cleaned[start:end])
+        try:
+            value = json.loads(fixed, strict=False)
+            value, missing = _validate(_shape(value, is_array, schema), is_array, schema)
+        except (json.JSONDecodeError, JSONExtractionError) as e:
+            errors.append(str(e))
+            continue
+        # Prefer complete data, then fewer repairs, then the larger span
+        score = (-len(missing), -len(repairs), end - start)
+        if best is None or score > best[0]:
+            best = (score, value, {"repairs": sorted(repairs), "missing": missing})
+    if best is None:
+        detail = f" ({errors[-1]})" if errors else ""
+        raise JSONExtractionError(f"No valid JSON found{detail} in: {cleaned[:300]}")
+    return best[1], best[2]
+
+
+def extract_json(text, is_array=False, schema=None):
+    value, report = extract_json_report(text, is_array=is_array, schema=schema)
+    if report["missing"]:
+        log.warning("⚠️ Partial JSON — filled defaults for: %s", ", ".join(report["missing"]))
+    return value
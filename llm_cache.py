@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# =============================
+# 💾 PERSISTENT LLM RESPONSE CACHE
+# =============================
+# Responses are keyed on a hash of everything that affects the completion.
+# SQLite in WAL mode lets several Streamlit worker processes share one file;
+# each thread keeps its own connection and every operation is a single
+# short transaction.
+DEFAULT_PATH = ".llm_cache.sqlite3"
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def cache_key(provider, model, prompt, temperature, max_tokens):
+    raw = json.dumps([provider, model, prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                provider TEXT, model TEXT,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @classmethod
+    def from_env(cls):
+        if os.getenv("LLM_CACHE", "1").lower() in ("0", "false", "off", "no"):
+            return None
+        return cls(
+            path=os.getenv("LLM_CACHE_PATH", DEFAULT_PATH),
+            ttl=float(os.getenv("LLM_CACHE_TTL", DEFAULT_TTL)),
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    def _bump(self, conn, name):
+        conn.execute(
+            "INSERT INTO counters(name, value) VALUES(?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, provider, model, prompt, temperature, max_tokens):
+        key = cache_key(provider, model, prompt, temperature, max_tokens)
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row[1] > self.ttl:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            self._bump(conn, "misses")
+            return None
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+        self._bump(conn, "hits")
+        return row[0]
+
+    def set(self, provider, model, prompt, temperature, max_tokens, value):
+        key = cache_key(provider, model, prompt, temperature, max_tokens)
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries(key, provider, model, value, created_at, last_access) "
+                "VALUES(?, ?, ?, ?, ?, ?)", (key, provider, model, value, now, now))
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+            # LRU: keep only the most recently used max_entries rows
+            conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM counters")
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        conn = self._conn()
+        shared = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            # Counters shared by every process using this cache file
+            "total_hits": shared.get("hits", 0),
+            "total_misses": shared.get("misses", 0),
+        }
+
+
+if __name__ == "__main__":
+    cache = LLMCache(path=os.getenv("LLM_CACHE_PATH", DEFAULT_PATH))
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "clear":
+        cache.clear()
+        print("🧹 LLM cache cleared")
+    else:
+        print(json.dumps(cache.stats(), indent=2))
@@ -0,0 +1,37 @@
+# =============================
+# 📍 SUPPORTED LOCATIONS
+# =============================
+# Shared by the Streamlit sidebar and the agents (local query parsing).
+STATES = [
+    "Maharashtra", "Kerala", "Goa", "Rajasthan", "Karnataka",
+    "Tamil Nadu", "Uttar Pradesh", "Delhi", "West Bengal", "Gujarat",
+    "Madhya Pradesh", "Himachal Pradesh", "Uttarakhand", "Punjab",
+    "Andhra Pradesh", "Telangana", "Haryana", "Jammu and Kashmir",
+    "Odisha", "Assam", "Bihar", "Jharkhand", "Chhattisgarh"
+]
+
+CITIES = {
+    "Maharashtra": ["Mumbai", "Pune", "Lonavala", "Nashik", "Aurangabad", "Nagpur", "Kolhapur", "Mahabaleshwar"],
+    "Kerala": ["Kochi", "Munnar", "Alleppey", "Thiruvananthapuram", "Wayanad", "Kovalam", "Thekkady"],
+    "Goa": ["Panaji", "Baga", "Calangute", "Anjuna", "Palolem", "Margao", "Candolim"],
+    "Rajasthan": ["Jaipur", "Udaipur", "Jodhpur", "Jaisalmer", "Pushkar", "Mount Abu", "Bikaner"],
+    "Karnataka": ["Bangalore", "Mysore", "Coorg", "Hampi", "Mangalore", "Udupi", "Chikmagalur"],
+    "Tamil Nadu": ["Chennai", "Madurai", "Coimbatore", "Ooty", "Kodaikanal", "Rameswaram", "Kanyakumari"],
+    "Uttar Pradesh": ["Agra", "Varanasi", "Lucknow", "Mathura", "Vrindavan", "Allahabad", "Ayodhya"],
+    "Delhi": ["New Delhi", "Old Delhi", "Connaught Place", "Dwarka", "Hauz Khas"],
+    "West Bengal": ["Kolkata", "Darjeeling", "Siliguri", "Durgapur", "Digha", "Kalimpong"],
+    "Gujarat": ["Ahmedabad", "Surat", "Vadodara", "Dwarka", "Somnath", "Gir", "Kutch"],
+    "Madhya Pradesh": ["Bhopal", "Indore", "Ujjain", "Gwalior", "Khajuraho", "Pachmarhi"],
+    "Himachal Pradesh": ["Shimla", "Manali", "Dharamshala", "Kullu", "Kasauli", "Dalhousie", "Spiti"],
+    "Uttarakhand": ["Dehradun", "Mussoorie", "Nainital", "Rishikesh", "Haridwar", "Auli", "Jim Corbett"],
+    "Punjab": ["Amritsar", "Chandigarh", "Ludhiana", "Patiala", "Jalandhar", "Pathankot"],
+    "Andhra Pradesh": ["Visakhapatnam", "Vijayawada", "Tirupati", "Amaravati", "Araku Valley"],
+    "Telangana": ["Hyderabad", "Warangal", "Nizamabad", "Karimnagar", "Khammam"],
+    "Haryana": ["Gurgaon", "Faridabad", "Ambala", "Karnal", "Panipat", "Kurukshetra"],
+    "Jammu and Kashmir": ["Srinagar", "Gulmarg", "Pahalgam", "Jammu", "Leh", "Ladakh", "Sonamarg"],
+    "Odisha": ["Bhubaneswar", "Puri", "Konark", "Cuttack", "Chilika", "Gopalpur"],
+    "Assam": ["Guwahati", "Kaziranga", "Tezpur", "Jorhat", "Majuli", "Sivasagar"],
+    "Bihar": ["Patna", "Bodh Gaya", "Nalanda", "Rajgir", "Gaya", "Vaishali"],
+    "Jharkhand": ["Ranchi", "Jamshedpur", "Dhanbad", "Netarhat", "Deoghar"],
+    "Chhattisgarh": ["Raipur", "Bilaspur", "Bhilai", "Durg", "Jagdalpur"]
+}
@@ -0,0 +1,138 @@
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import agents
+from http_pool import warm_connection
+from telemetry import get_logger, span
+
+# =============================
+# 🔮 SPECULATIVE PREFETCH
+# =============================
+# The sidebar knows the user's city before Generate is clicked, and most
+# queries are about that city. Prefetcher.start(state, city) warms the
+# provider connections and fetches the city's destinations and cost
+# baseline in the background. A pipeline given the Prefetch uses those
+# results when the query resolves to the same city and discards them
+# otherwise. All prefetches share a small worker pool; cancelling one (the
+# selection changed) drops its queued work, and work already running
+# finishes and is counted as wasted.
+PREFETCH_ENABLED = os.getenv("PREFETCH", "1").lower() not in ("0", "false", "off", "no")
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+# Pipeline stages a prefetch can serve
+PREFETCH_STAGES = ("destinations", "baseline")
+
+log = get_logger("prefetch")
+
+# started | hits | wasted | cancelled | failed, per stage
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def _record(outcome, stage):
+    with _counts_lock:
+        _counts[outcome] += 1
+        _counts[f"{stage}.{outcome}"] += 1
+
+
+def _same_city(a, b):
+    return str(a or "").strip().lower() == str(b or "").strip().lower()
+
+
+class Prefetch:
+    # One speculative fetch for a (state, city); each stage's result is used or discarded once
+    def __init__(self, state, city):
+        self.state = state
+        self.city = city
+        self.futures = {}  # stage -> Future
+        self.warming = None
+        self._settled = set()
+        self._lock = threading.Lock()
+
+    def _settle(self, stage, outcome):
+        with self._lock:
+            if stage in self._settled:
+                return False
+            self._settled.add(stage)
+        _record(outcome, stage)
+        return True
+
+    def _discard(self, stage):
+        # Queued work never runs; running or finished work was wasted
+        future = self.futures[stage]
+        self._settle(stage, "cancelled" if future.cancel() else "wasted")
+
+    def take(self, stage, parsed):
+        # The prefetched result for `stage`, or None when the pipeline has to do the work itself
+        future = self.futures.get(stage)
+        if future is None or stage in self._settled:
+            return None
+        if not _same_city(parsed.get("city"), self.city):
+            log.info("🔮 [%s] query is for %s, discarding the %s prefetch", stage, parsed.get("city"), self.city)
+            self._discard(stage)
+            return None
+        if future.cancel():
+            # Still queued behind other prefetches: running it inline is quicker than waiting
+            self._settle(stage, "cancelled")
+            return None
+        try:
+            result = future.result()
+        except Exception as e:
+            self._settle(stage, "failed")
+            log.info("🔮 [%s] prefetch for %s failed: %s", stage, self.city, e)
+            return None
+        self._settle(stage, "hits")
+        return result
+
+    def cancel(self):
+        if self.warming:
+            self.warming.cancel()
+        for stage in self.futures:
+            if stage not in self._settled:
+                self._discard(stage)
+
+
+class Prefetcher:
+    def __init__(self, orchestrator, max_workers=PREFETCH_WORKERS, enabled=None):
+        self.orchestrator = orchestrator
+        self.enabled = PREFETCH_ENABLED if enabled is None else enabled
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+    def start(self, state, city):
+        # Returns the Prefetch to hand to the pipeline; cancel() it when the selection changes
+        prefetch = Prefetch(state, city)
+        if not self.enabled or not city:
+            return prefetch
+        log.info("🔮 PREFETCH: %s, %s", city, state)
+        tasks = {
+            "destinations": lambda: self.orchestrator.agent1.find_destinations({"city": city, "state": state}),
+            "baseline": lambda: self.orchestrator.agent3.fetch_baseline(city),
+        }
+        for stage in PREFETCH_STAGES:
+            prefetch.futures[stage] = self._pool.submit(self.run, stage, city, tasks[stage])
+            _record("started", stage)
+        # Queued last: the fetches above open connections of their own
+        prefetch.warming = self._pool.submit(self.warm)
+        return prefetch
+
+    def run(self, stage, city, fn):
+        with span("prefetch", stage=stage, city=city):
+            return fn()
+
+    def warm(self):
+        # Connections for the planner and summarizer calls that follow
+        if agents.cassette and agents.cassette.replaying:
+            return
+        warm_connection("groq", agents.GROQ_API_URL)
+        warm_connection("cohere", agents.COHERE_API_URL)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def prefetch_stats():
+    with _counts_lock:
+        counts = dict(_counts)
+    settled = sum(counts.get(outcome, 0) for outcome in ("hits", "wasted", "cancelled", "failed"))
+    return {**counts, "hit_rate": counts.get("hits", 0) / settled if settled else 0.0}
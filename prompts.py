@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+from collections import Counter, namedtuple
+
+from telemetry import get_logger
+from tokens import estimate_tokens
+
+# =============================
+# ✂️ PROMPT BUDGETS & COMPACTION
+# =============================
+# Every agent prompt is built here. Payloads are serialized without
+# whitespace and projected down to the fields the receiving agent uses.
+# Each prompt is checked against its agent's input budget; list payloads
+# lose trailing items until they fit. The agent's output budget becomes
+# the request's max_tokens, which also caps what the rate limiter
+# reserves. The ledger counts tokens sent and saved per agent.
+# Budgets are estimated tokens (see tokens.py): agent -> (input, output)
+PROMPT_BUDGETS = {
+    "resolver": (150, 150),
+    "destinations": (100, 600),
+    "baseline": (100, 400),
+    "planner": (300, 1200),
+    "planner_combined": (450, 3600),
+    "summarizer": (1200, 500),
+}
+# PROMPT_BUDGET_SCALE=1.5 loosens every input budget by half
+BUDGET_SCALE = float(os.getenv("PROMPT_BUDGET_SCALE", "1.0"))
+
+# Itinerary fields the summarizer writes about; cost_breakdown etc. stay behind
+SUMMARY_DAY_FIELDS = ("day", "place", "activities", "daily_cost")
+
+Prompt = namedtuple("Prompt", ["text", "max_tokens"])
+
+log = get_logger("prompts")
+
+
+def compact_json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def project(records, fields):
+    return [{f: r[f] for f in fields if f in r} for r in records]
+
+
+class PromptLedger:
+    def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, agent, **counts):
+        with self._lock:
+            self.totals.setdefault(agent, Counter()).update(counts)
+
+    def stats(self):
+        with self._lock:
+            report = {}
+            for agent, c in self.totals.items():
+                baseline = c["input_tokens"] + c["saved_tokens"]
+                report[agent] = {
+                    "prompts": c["prompts"],
+                    "input_tokens": c["input_tokens"],
+                    "avg_input_tokens": round(c["input_tokens"] / c["prompts"], 1) if c["prompts"] else 0.0,
+                    "output_budget": PROMPT_BUDGETS[agent][1],
+                    "saved_tokens": c["saved_tokens"],
+                    "saved_pct": round(100.0 * c["saved_tokens"] / baseline, 1) if baseline else 0.0,
+                    "trimmed_items": c["trimmed_items"],
+                    "over_budget": c["over_budget"],
+                }
+            return report
+
+    def reset(self):
+        with self._lock:
+            self.totals.clear()
+
+
+ledger = PromptLedger()
+
+
+def build(agent, text, saved_tokens=0):
+    # A fixed prompt: counted against the agent's budget, sent even when over
+    input_budget, output_budget = PROMPT_BUDGETS[agent]
+    tokens = estimate_tokens(text)
+    over = tokens > input_budget * BUDGET_SCALE
+    if over:
+        log.warning("✂️ [%s] prompt is %d tokens, budget %d", agent, tokens, input_budget * BUDGET_SCALE)
+    ledger.record(agent, prompts=1, input_tokens=tokens, saved_tokens=saved_tokens, over_budget=int(over))
+    return Prompt(text, output_budget)
+
+
+def build_fitted(agent, render, items, verbose=None):
+    # render(items, omitted) -> text. Trailing items are dropped until the prompt
+    # fits the input budget (at least one is kept). `verbose` is the payload as it
+    # was sent before compaction; the tokens saved against it go in the ledger.
+    input_budget = PROMPT_BUDGETS[agent][0] * BUDGET_SCALE
+    kept = len(items)
+    text = render(items, 0)
+    while estimate_tokens(text) > input_budget and kept > 1:
+        kept -= 1
+        text = render(items[:kept], len(items) - kept)
+    if kept < len(items):
+        log.info("✂️ [%s] dropped %d of %d items to fit %d tokens", agent, len(items) - kept, len(items),
+                 input_budget)
+    saved = 0
+    if verbose is not None:
+        saved = max(0, estimate_tokens(json.dumps(verbose, indent=2))
+                    - estimate_tokens(compact_json(items)))
+    ledger.record(agent, trimmed_items=len(items) - kept)
+    return build(agent, text, saved_tokens=saved)
+
+
+def prompt_stats():
+    return ledger.stats()
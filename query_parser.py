@@ -0,0 +1,193 @@
+import re
+import threading
+from collections import Counter
+
+from locations import STATES, CITIES
+
+# =============================
+# ⚡ LOCAL QUERY PARSER (FAST PATH)
+# =============================
+# Rule-based extraction of state/city/days/budget/style using the sidebar's
+# location table as a gazetteer. Returns a confidence score so the resolver
+# only pays for an LLM round trip when the query is genuinely free-form.
+MIN_CONFIDENCE = 0.75
+
+_STATE_BY_NAME = {s.lower(): s for s in STATES}
+# City -> states it belongs to ("Dwarka" is listed under Delhi and Gujarat)
+_CITY_STATES = {}
+for _state, _cities in CITIES.items():
+    for _city in _cities:
+        _CITY_STATES.setdefault(_city.lower(), []).append(_state)
+_CITY_NAMES = {c.lower(): c for cs in CITIES.values() for c in cs}
+
+
+def _alternation(names):
+    # Longest first so "New Delhi" wins over "Delhi", "Bodh Gaya" over "Gaya"
+    return "|".join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+
+
+_STATE_RE = re.compile(rf"\b({_alternation(_STATE_BY_NAME)})\b")
+_CITY_RE = re.compile(rf"\b({_alternation(_CITY_NAMES)})\b")
+# The app prepends "state <State> city <City>" when the query names neither
+_PREFIX_RE = re.compile(rf"^\s*state ({_alternation(_STATE_BY_NAME)}) city ({_alternation(_CITY_NAMES)})\b")
+
+_DAYS_RE = re.compile(r"\b(\d{1,2})\s*-?\s*(?:days?|nights?)\b")
+_WEEKS_RE = re.compile(r"\b(a|one|1|two|2)\s*-?\s*weeks?\b")
+# A number followed by a duration ("under 4 days") is a trip length, not an amount
+_NUMBER = r"(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|lakh|lakhs)?\b(?!\s*-?\s*(?:days?|nights?|weeks?)\b)"
+_AMOUNT = rf"(?:₹|rs\.?|inr)?\s*{_NUMBER}"
+# Tried in order: an explicit "budget ..." or currency amount wins over the generic limit words
+_BUDGET_RES = [
+    re.compile(rf"\bbudget(?:\s+of)?\s*:?\s*{_AMOUNT}"),
+    re.compile(rf"(?:₹|\brs\.?|\binr)\s*{_NUMBER}"),
+    re.compile(rf"\b(?:under|within|below|upto|up to|max(?:imum)?|less than)\s*:?\s*{_AMOUNT}"),
+]
+
+_STYLE_WORDS = [
+    ("relaxed", ("relax", "leisure", "slow", "laid back", "chill")),
+    ("packed", ("packed", "fast paced", "fast-paced", "adventure", "action")),
+    ("luxury", ("luxury", "luxurious", "premium")),
+    ("budget", ("cheap", "backpack", "budget trip", "budget-friendly", "budget friendly")),
+]
+_WORD_NUMBERS = {"a": 1, "one": 1, "1": 1, "two": 2, "2": 2}
+# Words that say nothing about where, how long or how much. Anything else left over
+# may be a place the gazetteer doesn't know ("Shillong"), so the sidebar city isn't assumed.
+_FILLER_WORDS = set("""
+a an the i me my we us our to for of in on at with and or from near around by trip trips tour travel
+travelling traveling holiday holidays vacation getaway plan plans planning want wants need would like
+please suggest visit visiting go going explore exploring days day nights night week weeks weekend
+budget under within below upto up max maximum less than rs inr k thousand lakh lakhs rupees total
+around about some good best nice itinerary state city style
+""".split())
+# Queries that explicitly ask for several candidate destinations rather than one city
+_MULTI_RE = re.compile(r"\b(?:multiple|several|different|few)\s+(?:[a-z-]+\s+){0,2}"
+                       r"(?:trips|destinations|places|getaways|options|cities)\b")
+# Wording that may ask for suggestions; whether it does depends on the city the query resolves to
+_HINT_RE = re.compile(r"\b(?:suggest|options|compare|getaways?|trips|destinations|places|where)\b")
+# A city named as the starting point ("getaway near Pune"), not as the destination
+_ORIGIN_RE = re.compile(rf"\b(?:near|around)\s+({_alternation(_CITY_NAMES)})\b")
+
+_path_counts = Counter()
+_path_lock = threading.Lock()
+
+
+def _amount(number, unit):
+    value = float(number.replace(",", ""))
+    if unit in ("k", "thousand"):
+        value *= 1000
+    elif unit in ("lakh", "lakhs"):
+        value *= 100000
+    return int(value)
+
+
+def parse_locally(query):
+    text = query.lower()
+    result = {"state": None, "city": None, "days": 0, "budget": 0, "style": "balanced"}
+    confidence = 0.0
+
+    prefix = _PREFIX_RE.match(text)
+    body = text[prefix.end():] if prefix else text
+
+    # Parts of the body each rule accounted for; whatever is left is checked at the end
+    consumed = []
+    city_matches = list(_CITY_RE.finditer(body))
+    state_matches = list(_STATE_RE.finditer(body))
+    consumed += [m.span() for m in city_matches + state_matches]
+    cities = list(dict.fromkeys(m.group(1) for m in city_matches))
+    states = list(dict.fromkeys(m.group(1) for m in state_matches))
+    from_prefix = bool(prefix and not cities)
+    if from_prefix:
+        cities, states = [prefix.group(2)], states or [prefix.group(1)]
+
+    if cities:
+        city = cities[0]
+        candidates = _CITY_STATES[city]
+        state = next((_STATE_BY_NAME[s] for s in states if _STATE_BY_NAME[s] in candidates), candidates[0])
+        result["city"], result["state"] = _CITY_NAMES[city], state
+        confidence += 0.5
+        # Several places ("Mumbai to Goa") or an ambiguous name need the LLM
+        if len(cities) > 1 or (len(candidates) > 1 and not states):
+            confidence -= 0.3
+        elif states and not any(_STATE_BY_NAME[s] == state for s in states):
+            confidence -= 0.3
+    elif states:
+        result["state"] = _STATE_BY_NAME[states[0]]
+
+    days = _DAYS_RE.search(body)
+    weeks = _WEEKS_RE.search(body)
+    if days:
+        result["days"] = int(days.group(1))
+        consumed.append(days.span())
+    elif weeks:
+        result["days"] = 7 * _WORD_NUMBERS[weeks.group(1)]
+        consumed.append(weeks.span())
+    elif "weekend" in body:
+        result["days"] = 2
+    if result["days"]:
+        confidence += 0.25
+
+    budget = next((m for m in (r.search(body) for r in _BUDGET_RES) if m), None)
+    if budget:
+        result["budget"] = _amount(budget.group(1), budget.group(2))
+        consumed.append(budget.span())
+        confidence += 0.25
+
+    for style, words in _STYLE_WORDS:
+        if any(w in body for w in words):
+            result["style"] = style
+            break
+    style_words = {part for _, words in _STYLE_WORDS for w in words for part in re.split(r"[\s-]", w)}
+
+    leftover = list(body)
+    for start, end in consumed:
+        leftover[start:end] = " " * (end - start)
+    leftover = "".join(leftover)
+    unknown = [w for w in re.findall(r"[a-z]+", leftover)
+               if w not in _FILLER_WORDS and not any(w.startswith(s) for s in style_words)]
+
+    # The LLM resolver decides when: there is no trip length or budget (it fills them
+    # in), a number wasn't assigned to either ("Agra 3 days 8000"), or the city only
+    # comes from the sidebar prefix while the body mentions something else
+    if (not result["days"] or not result["budget"] or re.search(r"\d", leftover)
+            or (from_prefix and unknown)):
+        confidence = min(confidence, MIN_CONFIDENCE - 0.25)
+
+    return result, max(confidence, 0.0)
+
+
+def comparison_intent(query):
+    # (compare, near) from the wording alone. compare is True for an explicit request
+    # for several destinations ("multiple trips", "getaway near Pune"), False when
+    # nothing hints at one, and None when only the resolved city can tell: "suggest a
+    # trip" is a comparison unless it resolves to a destination other than the sidebar
+    # city. near: the named city is the origin to leave out.
+    text = query.lower()
+    prefix = _PREFIX_RE.match(text)
+    body = text[prefix.end():] if prefix else text
+    cities = {m.group(1) for m in _CITY_RE.finditer(body)}
+    origins = {m.group(1) for m in _ORIGIN_RE.finditer(body)}
+    if len(cities) == 1 and cities == origins:
+        return True, True
+    if cities:
+        return False, False
+    if _MULTI_RE.search(body):
+        return True, False
+    return (None if _HINT_RE.search(body) else False), False
+
+
+def prefix_city(query):
+    # The sidebar city the app prepended ("state <State> city <City> ..."), if any
+    prefix = _PREFIX_RE.match(query.lower())
+    return _CITY_NAMES[prefix.group(2)] if prefix else None
+
+
+def record_path(path):
+    with _path_lock:
+        _path_counts[path] += 1
+
+
+def path_stats():
+    with _path_lock:
+        counts = dict(_path_counts)
+    total = sum(counts.values())
+    return {**counts, "total": total, "fast_path_rate": counts.get("fast_path", 0) / total if total else 0.0}
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# =============================
+# 🚦 PER-PROVIDER RATE LIMITING
+# =============================
+# One limiter per (provider, model). Each budgets requests-per-minute and
+# estimated tokens-per-minute with token buckets, and caps concurrency with
+# an AIMD limit: +1/limit per good response, halved on a 429 (or trimmed
+# when latency exceeds the target). Callers queue FIFO instead of failing.
+# A value of 0 for RPM/TPM means "no limit".
+DEFAULT_LIMITS = {
+    "groq": {
+        "rpm": int(os.getenv("GROQ_RPM", "60")),
+        "tpm": int(os.getenv("GROQ_TPM", "100000")),
+        "max_concurrency": int(os.getenv("GROQ_MAX_CONCURRENCY", "3")),
+        "latency_target": float(os.getenv("GROQ_LATENCY_TARGET", "0")),
+    },
+    "cohere": {
+        "rpm": int(os.getenv("COHERE_RPM", "100")),
+        "tpm": int(os.getenv("COHERE_TPM", "0")),
+        "max_concurrency": int(os.getenv("COHERE_MAX_CONCURRENCY", "3")),
+        "latency_target": float(os.getenv("COHERE_LATENCY_TARGET", "0")),
+    },
+}
+# Per-model overrides, e.g. {("groq", "qwen/qwen3-32b"): {"rpm": 60, "tpm": 6000}}
+MODEL_LIMITS = {}
+
+DECREASE_FACTOR = 0.5
+LATENCY_DECREASE_FACTOR = 0.9
+DECREASE_COOLDOWN = 1.0  # one multiplicative decrease per burst of 429s
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        # Seconds until `amount` is available; oversize requests wait for a full bucket
+        if not self.capacity:
+            return 0.0
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= min(amount, self.capacity)
+
+
+class Ticket:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.status = None
+        self.retry_after = None
+        self.started = time.monotonic()
+
+
+class RateLimiter:
+    def __init__(self, name, rpm=0, tpm=0, max_concurrency=3, min_concurrency=1, latency_target=0):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target = latency_target
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.latency_ewma = None
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+    def _wait_needed(self, me, tokens, now):
+        # None = wait for a release; otherwise seconds until the buckets allow us
+        if self._waiting[0] is not me or self.in_flight >= max(1, int(self.limit)):
+            return None
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self.blocked_until - now, self.requests.wait_for(1), self.tokens.wait_for(tokens), 0.0)
+
+    def acquire(self, tokens=0):
+        ticket, enqueued = Ticket(tokens), time.monotonic()
+        with self._cond:
+            self._waiting.append(ticket)
+            try:
+                while True:
+                    delay = self._wait_needed(ticket, tokens, time.monotonic())
+                    if delay == 0.0:
+                        break
+                    self._cond.wait(timeout=delay)
+            except BaseException:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+                raise
+            self._waiting.popleft()
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            waited = time.monotonic() - enqueued
+            self.stats["requests"] += 1
+            self.stats["wait_total"] += waited
+            self.stats["wait_max"] = max(self.stats["wait_max"], waited)
+            # The next caller in line may be able to go too
+            self._cond.notify_all()
+        ticket.started = time.monotonic()
+        return ticket
+
+    def release(self, ticket):
+        now = time.monotonic()
+        latency = now - ticket.started
+        with self._cond:
+            self.in_flight -= 1
+            if ticket.status == 429:
+                self.stats["throttled"] += 1
+                if ticket.retry_after:
+                    self.blocked_until = max(self.blocked_until, now + ticket.retry_after)
+                self._decrease(now, DECREASE_FACTOR)
+            elif ticket.status is None or ticket.status >= 500:
+                self.stats["errors"] += 1
+            else:
+                self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+                if self.latency_target and latency > self.latency_target:
+                    self._decrease(now, LATENCY_DECREASE_FACTOR)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def _decrease(self, now, factor):
+        if now - self.last_decrease >= DECREASE_COOLDOWN:
+            self.limit = max(self.min_concurrency, self.limit * factor)
+            self.last_decrease = now
+
+    @contextmanager
+    def request(self, tokens=0):
+        ticket = self.acquire(tokens)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def snapshot(self):
+        with self._cond:
+            requests = self.stats["requests"]
+            return {
+                "queue_depth": len(self._waiting),
+                "in_flight": self.in_flight,
+                "concurrency_limit": round(self.limit, 2),
+                "requests": requests,
+                "throttled": self.stats["throttled"],
+                "errors": self.stats["errors"],
+                "wait_avg": self.stats["wait_total"] / requests if requests else 0.0,
+                "wait_max": self.stats["wait_max"],
+                "latency_ewma": self.latency_ewma,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider, model):
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            config = {**DEFAULT_LIMITS.get(provider, {}), **MODEL_LIMITS.get(key, {})}
+            limiter = RateLimiter(f"{provider}:{model}", **config)
+            _limiters[key] = limiter
+        return limiter
+
+
+def limiter_stats():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {limiter.name: limiter.snapshot() for limiter in limiters.values()}
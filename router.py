@@ -0,0 +1,137 @@
+import os
+import threading
+from collections import Counter
+
+from hedging import InvalidResponse, latency_tracker
+from json_extract import JSONExtractionError
+from locations import CITIES
+from telemetry import current_span, get_logger
+
+# =============================
+# 🔀 LATENCY-AWARE MODEL ROUTING
+# =============================
+# Each agent has model tiers, smallest first. A call starts at the tier the
+# agent's input needs (its complexity), and moves down to a smaller tier
+# when the chosen model's observed p95 would miss the latency SLO. Models
+# whose recent error rate is too high are skipped. A call escalates one
+# tier up only when the response fails validation, i.e. it is unparseable
+# or breaks the schema. Provider errors and slow calls are left to hedging
+# (hedging.py). With ROUTER=0 every agent uses its largest tier.
+ROUTING_ENABLED = os.getenv("ROUTER", "1").lower() not in ("0", "false", "off", "no")
+# Target seconds per model call (0 = no SLO); MultiAgentOrchestrator(latency_slo=...) overrides it
+LATENCY_SLO = float(os.getenv("ROUTER_SLO", "0"))
+SLO_PERCENTILE = 95
+# Latency/error stats are trusted once a model has this many observations
+MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "10"))
+MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.3"))
+
+MODEL_TIERS = {
+    "resolver": [("groq", "llama-3.1-8b-instant"), ("cohere", "command-r-08-2024")],
+    "destinations": [("groq", "llama-3.1-8b-instant"), ("groq", "qwen/qwen3-32b")],
+    "baseline": [("groq", "llama-3.1-8b-instant"), ("groq", "qwen/qwen3-32b")],
+    "planner": [("groq", "llama-3.1-8b-instant"), ("groq", "llama-3.3-70b-versatile")],
+    "planner_combined": [("groq", "llama-3.3-70b-versatile")],
+    "summarizer": [("cohere", "command-r-08-2024"), ("cohere", "command-r-plus-08-2024")],
+}
+
+# Complexity thresholds used by the agents: inputs at or below these start on tier 0
+SIMPLE_QUERY_CHARS = 80
+SIMPLE_PLAN_DAYS = 2
+SIMPLE_SUMMARY_DAYS = 3
+
+_KNOWN_CITIES = {c.lower() for cities in CITIES.values() for c in cities}
+
+log = get_logger("router")
+
+
+def known_city(city):
+    # Cities in locations.py are well covered by every model
+    return str(city).strip().lower() in _KNOWN_CITIES
+
+
+class ModelRouter:
+    def __init__(self, enabled=None, slo=None):
+        self.enabled = ROUTING_ENABLED if enabled is None else enabled
+        self.slo = LATENCY_SLO if slo is None else slo
+        self.picks = Counter()        # "agent provider:model" -> calls started there
+        self.reasons = Counter()      # complexity | slo | health | disabled
+        self.escalations = Counter()  # agent -> validation failures that moved up a tier
+        self._lock = threading.Lock()
+
+    def healthy(self, provider, model):
+        seen, error_rate = latency_tracker.health(provider, model)
+        return seen < MIN_SAMPLES or error_rate <= MAX_ERROR_RATE
+
+    def meets_slo(self, provider, model):
+        if not self.slo:
+            return True
+        seen, _ = latency_tracker.health(provider, model)
+        if seen < MIN_SAMPLES:
+            return True
+        return latency_tracker.percentile(provider, model, SLO_PERCENTILE) <= self.slo
+
+    def pick(self, agent, complexity=0):
+        # Tier index to start from, and why
+        tiers = MODEL_TIERS[agent]
+        if not self.enabled:
+            return len(tiers) - 1, "disabled"
+        start = max(0, min(complexity, len(tiers) - 1))
+        # Preferred tier first, then smaller (faster) ones, then larger ones
+        order = [start] + list(range(start - 1, -1, -1)) + list(range(start + 1, len(tiers)))
+        healthy = [i for i in order if self.healthy(*tiers[i])]
+        for i in healthy:
+            if self.meets_slo(*tiers[i]):
+                return i, "complexity" if i == start else ("slo" if i < start else "health")
+        # Nothing meets the SLO: the fastest healthy option is the smallest
+        if healthy:
+            return min(healthy), "slo"
+        return start, "complexity"
+
+    def route(self, agent, complexity=0):
+        # (provider, model) for callers that cannot escalate, e.g. streams
+        tier, reason = self.pick(agent, complexity)
+        provider, model = MODEL_TIERS[agent][tier]
+        self._record(agent, provider, model, reason)
+        return provider, model
+
+    def call(self, agent, call, prompt, parse, complexity=0):
+        # call(text, max_tokens=..., provider=..., model=...) -> text; parse(text) -> result.
+        # A response rejected by validation or parse moves one tier up, until the largest.
+        tiers = MODEL_TIERS[agent]
+        tier, reason = self.pick(agent, complexity)
+        while True:
+            provider, model = tiers[tier]
+            self._record(agent, provider, model, reason)
+            try:
+                return parse(call(prompt.text, max_tokens=prompt.max_tokens, provider=provider, model=model))
+            except (InvalidResponse, JSONExtractionError) as e:
+                if not self.enabled or tier == len(tiers) - 1:
+                    raise
+                log.info("⬆️ [%s] %s:%s output failed validation, escalating: %s", agent, provider, model, e)
+                with self._lock:
+                    self.escalations[agent] += 1
+                current_span().add("escalations")
+                tier, reason = tier + 1, "escalation"
+
+    def _record(self, agent, provider, model, reason):
+        with self._lock:
+            self.picks[f"{agent} {provider}:{model}"] += 1
+            self.reasons[reason] += 1
+        current_span().set(route=f"{provider}:{model}", route_reason=reason)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "slo": self.slo,
+                "picks": dict(self.picks),
+                "reasons": dict(self.reasons),
+                "escalations": dict(self.escalations),
+            }
+
+
+model_router = ModelRouter()
+
+
+def router_stats():
+    return model_router.stats()
@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.web
+from tornado.httpclient import AsyncHTTPClient
+from tornado.iostream import StreamClosedError
+
+import telemetry
+from agents import MultiAgentOrchestrator, PLANNER_MODES, EVENT_DONE, EVENT_SUMMARY_CHUNK
+from batch import load_queries, log, percentile
+from hedging import hedging_stats
+from prompts import prompt_stats
+from rate_limit import limiter_stats
+from single_flight import single_flight_stats
+
+# =============================
+# 🌐 ASYNC HTTP SERVICE
+# =============================
+# Tornado (asyncio) front end for backends that want the planner without the
+# Streamlit UI:
+#   POST /plan        {"query": ..., "planner_mode": ..., "latency_slo": 5, "stream": true}
+#                     -> JSON result, or NDJSON events as each stage finishes
+#   POST /summarize   {"query": ...} -> the markdown summary, streamed as text
+#   GET  /health, GET /stats
+#   GET  /metrics     Prometheus text format;  GET /traces  recent spans as OTLP/JSON
+#                     (both need TRACING=1 or --trace)
+# The event loop never blocks: pipelines run on the agents' own thread pools
+# (pooled keep-alive HTTP, rate limiting, hedging, caching) and each event is
+# handed to the loop as it arrives. At most SERVICE_WORKERS pipelines run at
+# once and SERVICE_QUEUE more wait; anything beyond that gets a 503.
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8000"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "8"))
+SERVICE_QUEUE = int(os.getenv("SERVICE_QUEUE", "32"))
+RETRY_AFTER = 5  # seconds suggested to clients turned away with a 503
+MAX_LATENCY_SLO = 120
+
+DEFAULT_LOAD_QUERIES = [
+    "Mumbai 3 days budget 8000",
+    "Jaipur 4 days budget 15000",
+    "Munnar 2 days budget 6000",
+    "Goa 5 days budget 20000",
+]
+
+
+class Admission:
+    # Bounded queue in front of the pipelines: `workers` run, `queue_size` wait
+    def __init__(self, workers=SERVICE_WORKERS, queue_size=SERVICE_QUEUE):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.admitted = 0
+        self.running = 0
+        self.slots = asyncio.Semaphore(workers)
+        self.stats = Counter()
+
+    def admit(self):
+        if self.admitted >= self.capacity:
+            self.stats["rejected"] += 1
+            return False
+        self.admitted += 1
+        self.stats["admitted"] += 1
+        return True
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        try:
+            async with self.slots:
+                self.running += 1
+                try:
+                    yield
+                finally:
+                    self.running -= 1
+        finally:
+            self.admitted -= 1
+
+    def snapshot(self):
+        return {
+            "running": self.running,
+            "queued": self.admitted - self.running,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            **dict(self.stats),
+        }
+
+
+class PlannerService:
+    def __init__(self, workers=SERVICE_WORKERS, queue_size=SERVICE_QUEUE):
+        self.admission = Admission(workers, queue_size)
+        # Threads only wait for the next pipeline event; one per running pipeline
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="service")
+        self.orchestrators = {}
+
+    def orchestrator(self, mode, slo=None):
+        # One per planner mode and latency SLO, so each keeps its own routing stats
+        if (mode, slo) not in self.orchestrators:
+            self.orchestrators[mode, slo] = MultiAgentOrchestrator(planner_mode=mode, latency_slo=slo)
+        return self.orchestrators[mode, slo]
+
+    async def events(self, query, mode, slo=None):
+        loop = asyncio.get_running_loop()
+        events = self.orchestrator(mode, slo).iter_events(query)
+        try:
+            while True:
+                event = await loop.run_in_executor(self.executor, next, events, None)
+                if event is None:
+                    return
+                yield event
+        finally:
+            # Stops consuming; stages already started finish in the background
+            await loop.run_in_executor(self.executor, events.close)
+
+    def stats(self):
+        return {
+            "admission": self.admission.snapshot(),
+            "single_flight": single_flight_stats(),
+            "rate_limits": limiter_stats(),
+            "hedging": hedging_stats(),
+            "prompts": prompt_stats(),
+            "routing": {f"{mode}/slo={slo}": o.router.stats() for (mode, slo), o in self.orchestrators.items()},
+        }
+
+
+def event_json(event):
+    data = event.data
+    if event.type == EVENT_DONE:
+        # The full results were already streamed stage by stage
+        data = {k: v for k, v in data.items() if k != "results"}
+    return json.dumps({"type": event.type, "data": data}, ensure_ascii=False)
+
+
+def result_json(results, timings):
+    return {
+        "resolved": results["resolved"],
+        "costed": results["costed"],
+        "summary": results["summary"],
+        "plan_failures": results["plan_failures"],
+        "timings": timings,
+    }
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+        self.closed = False
+
+    def on_connection_close(self):
+        self.closed = True
+
+    def write_error(self, status_code, **kwargs):
+        self.set_header("Content-Type", "application/json")
+        error = self._reason
+        if "exc_info" in kwargs and not isinstance(kwargs["exc_info"][1], tornado.web.HTTPError):
+            error = str(kwargs["exc_info"][1])
+        self.finish({"error": error})
+
+    def parse_body(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except json.JSONDecodeError:
+            raise tornado.web.HTTPError(400, reason="Body must be JSON")
+        query = body.get("query") if isinstance(body, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            raise tornado.web.HTTPError(400, reason="Missing 'query'")
+        mode = body.get("planner_mode", "per_style")
+        if mode not in PLANNER_MODES:
+            raise tornado.web.HTTPError(400, reason=f"planner_mode must be one of {list(PLANNER_MODES)}")
+        slo = body.get("latency_slo")
+        if slo is not None:
+            if isinstance(slo, bool) or not isinstance(slo, (int, float)) or not 1 <= slo <= MAX_LATENCY_SLO:
+                raise tornado.web.HTTPError(400, reason=f"latency_slo must be 1-{MAX_LATENCY_SLO} seconds")
+            slo = round(slo)  # whole seconds keep the number of orchestrators small
+        return body, query, mode, slo
+
+    def reject(self):
+        self.set_header("Retry-After", str(RETRY_AFTER))
+        raise tornado.web.HTTPError(503, reason="Planner is at capacity, retry later")
+
+    async def send(self, text):
+        self.write(text)
+        try:
+            await self.flush()
+        except StreamClosedError:
+            self.closed = True
+
+
+class PlanHandler(BaseHandler):
+    async def post(self):
+        body, query, mode, slo = self.parse_body()
+        if not self.service.admission.admit():
+            self.reject()
+        async with self.service.admission.slot(), contextlib.aclosing(self.service.events(query, mode, slo)) as events:
+            if not body.get("stream"):
+                async for event in events:
+                    if event.type == EVENT_DONE:
+                        self.finish(result_json(event.data["results"], event.data["timings"]))
+                return
+            self.set_header("Content-Type", "application/x-ndjson")
+            try:
+                async for event in events:
+                    await self.send(event_json(event) + "\n")
+                    if self.closed:
+                        return
+            except Exception as e:
+                # Headers are already sent, so the failure goes in the stream
+                await self.send(json.dumps({"type": "error", "data": str(e)}) + "\n")
+
+
+class SummarizeHandler(BaseHandler):
+    async def post(self):
+        _, query, mode, slo = self.parse_body()
+        if not self.service.admission.admit():
+            self.reject()
+        async with self.service.admission.slot(), contextlib.aclosing(self.service.events(query, mode, slo)) as events:
+            self.set_header("Content-Type", "text/markdown; charset=utf-8")
+            async for event in events:
+                if event.type == EVENT_SUMMARY_CHUNK:
+                    await self.send(event.data)
+                    if self.closed:
+                        return
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.finish({"status": "ok", **self.service.admission.snapshot()})
+
+
+class StatsHandler(BaseHandler):
+    def get(self):
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(self.service.stats(), default=str))
+
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(telemetry.render_prometheus())
+
+
+class TracesHandler(BaseHandler):
+    def get(self):
+        # ?clear=1 drains the buffer so a collector polling this sees each span once
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(telemetry.export_spans(clear=self.get_argument("clear", "0") == "1")))
+
+
+def make_app(service):
+    return tornado.web.Application([
+        (r"/plan", PlanHandler, {"service": service}),
+        (r"/summarize", SummarizeHandler, {"service": service}),
+        (r"/health", HealthHandler, {"service": service}),
+        (r"/stats", StatsHandler, {"service": service}),
+        (r"/metrics", MetricsHandler, {"service": service}),
+        (r"/traces", TracesHandler, {"service": service}),
+    ])
+
+
+# =============================
+# 📈 LOAD TEST
+# =============================
+async def load_test(url, queries, concurrency, duration, stream=False):
+    client = AsyncHTTPClient(max_clients=concurrency)
+    latencies, statuses = [], Counter()
+    start = time.perf_counter()
+    deadline = start + duration
+
+    async def worker(i):
+        n = i
+        while time.perf_counter() < deadline:
+            body = json.dumps({"query": queries[n % len(queries)], "stream": stream})
+            n += concurrency
+            sent = time.perf_counter()
+            response = await client.fetch(f"{url}/plan", method="POST", body=body, raise_error=False,
+                                          request_timeout=600)
+            statuses[response.code] += 1
+            if response.code == 200:
+                latencies.append(time.perf_counter() - sent)
+            elif response.code == 503:
+                await asyncio.sleep(min(RETRY_AFTER, 0.5))
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "wall_seconds": round(wall, 2),
+        "completed": len(latencies),
+        "status_counts": dict(statuses),
+        "sustained_qps": round(len(latencies) / wall, 3) if wall > 0 else 0.0,
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_p99": round(percentile(latencies, 99), 3),
+    }
+
+
+async def serve(port, workers, queue_size):
+    service = PlannerService(workers, queue_size)
+    make_app(service).listen(port)
+    log(f"🌐 Planner service on http://localhost:{port} ({workers} workers, queue {queue_size})")
+    await asyncio.Event().wait()
+
+
+async def serve_and_load(args):
+    service = PlannerService(args.workers, args.queue)
+    server = make_app(service).listen(args.port)
+    queries = [q["query"] for q in load_queries(args.queries)] if args.queries else DEFAULT_LOAD_QUERIES
+    log(f"📈 Load test: {args.concurrency} clients for {args.duration}s against {len(queries)} queries")
+    try:
+        report = await load_test(f"http://localhost:{args.port}", queries, args.concurrency, args.duration,
+                                 stream=args.stream)
+    finally:
+        server.stop()
+    report["service"] = service.admission.snapshot()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async HTTP service for the travel planner")
+    parser.add_argument("command", nargs="?", default="serve", choices=["serve", "loadtest"])
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Pipelines run at once")
+    parser.add_argument("--queue", type=int, default=SERVICE_QUEUE, help="Requests waiting before 503s")
+    parser.add_argument("--concurrency", type=int, default=16, help="loadtest: concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="loadtest: seconds to run")
+    parser.add_argument("--queries", help="loadtest: JSONL file of queries (same format as batch.py)")
+    parser.add_argument("--stream", action="store_true", help="loadtest: request streamed responses")
+    parser.add_argument("--cpu", type=int, help="Pin the process to this CPU core")
+    parser.add_argument("--verbose", action="store_true", help="Log the agents' progress")
+    parser.add_argument("--trace", action="store_true", help="Record spans and metrics (same as TRACING=1)")
+    args = parser.parse_args()
+
+    if args.cpu is not None:
+        os.sched_setaffinity(0, {args.cpu})
+    if args.verbose:
+        telemetry.set_log_level("INFO")
+    if args.trace:
+        telemetry.enable()
+
+    if args.command == "serve":
+        asyncio.run(serve(args.port, args.workers, args.queue))
+        return
+    # Expected 503s would otherwise flood stderr
+    logging.getLogger("tornado.access").setLevel(logging.ERROR)
+    report = asyncio.run(serve_and_load(args))
+
+    log("\n📊 Load test report")
+    for key, value in report.items():
+        log(f"  {key:<15} {value}")
+
+
+if __name__ == "__main__":
+    main()
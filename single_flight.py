@@ -0,0 +1,105 @@
+import os
+import threading
+from collections import Counter, OrderedDict
+
+# =============================
+# 🛬 SINGLE-FLIGHT COALESCING
+# =============================
+# Identical work that is already in flight is joined rather than repeated:
+# the first caller for a key runs it, callers that arrive before it finishes
+# wait for and share its result (or its exception). Nothing is kept once the
+# work completes — finished results are the caches' job, not this layer's.
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT", "1").lower() not in ("0", "false", "off", "no")
+# Per-key counters kept for the most recently used keys
+MAX_TRACKED_KEYS = 500
+
+
+class _Flight:
+    def __init__(self, handle=None):
+        self.done = threading.Event()
+        self.handle = handle
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.totals = Counter()
+        self.per_key = OrderedDict()
+        _registry[name] = self
+
+    def _count(self, label, field):
+        # Called with the lock held
+        self.totals[field] += 1
+        counts = self.per_key.pop(label, None) or Counter()
+        counts[field] += 1
+        self.per_key[label] = counts
+        while len(self.per_key) > MAX_TRACKED_KEYS:
+            self.per_key.popitem(last=False)
+
+    def do(self, key, fn, label=None):
+        # Runs fn() once per key at a time; concurrent callers share the outcome
+        if not SINGLE_FLIGHT_ENABLED:
+            return fn()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            self._count(label or key, "executions" if leader else "shared")
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def attach(self, key, start, label=None):
+        # For work that runs in the background: returns the in-flight handle for
+        # key, or start()'s new one. The owner must call finish(key) when done.
+        if not SINGLE_FLIGHT_ENABLED:
+            return start()
+        # start() runs under the lock so no one can attach to a half-started flight
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._count(label or key, "shared")
+                return flight.handle
+            flight = _Flight(start())
+            self._flights[key] = flight
+            self._count(label or key, "executions")
+            return flight.handle
+
+    def finish(self, key):
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight is not None:
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "executions": self.totals["executions"],
+                "shared": self.totals["shared"],
+                "keys": {label: dict(counts) for label, counts in self.per_key.items()},
+            }
+
+
+_registry = {}
+
+
+def single_flight_stats():
+    return {name: flight.stats() for name, flight in _registry.items()}
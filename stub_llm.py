@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+
+import tornado.web
+
+from query_parser import parse_locally
+
+# =============================
+# 🧪 LOCAL STUB LLM SERVER
+# =============================
+# Speaks the Groq chat-completions and Cohere v2 chat formats (including
+# streaming) so the whole pipeline can be exercised without paid API calls:
+#   python stub_llm.py --port 8900 [--config stub.json] [--seed 1]
+#   GROQ_API_URL=http://localhost:8900/openai/v1/chat/completions \
+#   COHERE_API_URL=http://localhost:8900/v2/chat streamlit run app.py
+# Answers are templated from the agents' prompts (days, city, plan style...),
+# unless a configured {"match": regex, "text": ...} response matches first;
+# its text may use the regex's named groups as {placeholders}.
+DEFAULT_CONFIG = {
+    # Per provider, or per "provider:model". dist: fixed | uniform | lognormal (seconds)
+    "latency": {
+        "groq": {"dist": "lognormal", "median": 0.6, "sigma": 0.4},
+        "cohere": {"dist": "lognormal", "median": 1.2, "sigma": 0.5},
+    },
+    # Probability of answering with each status code instead of a completion
+    "error_rates": {"groq": {"429": 0.0, "500": 0.0}, "cohere": {"429": 0.0, "500": 0.0}},
+    "retry_after": 1,
+    # Streamed responses: words per chunk and delay between chunks
+    "stream_words": 4,
+    "stream_delay": 0.02,
+    "responses": [],
+}
+
+SUMMARY_TEMPLATE = """# ✈️ {days} Days in {city}
+
+Your **{plan}** plan keeps things comfortably within reach at about ₹{cost}.
+
+## Highlights
+- Morning walks through the old quarters
+- Local food trails every evening
+- Time set aside for the best-known sights
+
+Enjoy the trip! 🎒"""
+
+
+def merge_config(base, override):
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            value = merge_config(base[key], value)
+        merged[key] = value
+    return merged
+
+
+def sample_latency(spec, rng):
+    dist = spec.get("dist", "fixed")
+    if dist == "uniform":
+        return rng.uniform(spec.get("low", 0.0), spec.get("high", 1.0))
+    if dist == "lognormal":
+        return rng.lognormvariate(0.0, spec.get("sigma", 0.5)) * spec.get("median", 1.0)
+    return spec.get("value", spec.get("median", 0.0))
+
+
+def itinerary(name, style, days, city):
+    per_day = {"relaxed": 2, "balanced": 4, "packed": 6}.get(style, 4)
+    return {
+        "name": name,
+        "style": style,
+        "days": days,
+        "daywise": [
+            {
+                "day": d,
+                "place": f"{city} Highlight {d}",
+                "activities": [f"Activity {i + 1} at {city} Highlight {d}" for i in range(per_day)],
+            }
+            for d in range(1, days + 1)
+        ],
+    }
+
+
+def templated_answer(prompt):
+    # Mirrors the agents' prompts; anything unrecognised gets a short text reply
+    if m := re.search(r'Extract structured info from: "(.*)"', prompt, re.S):
+        parsed, _ = parse_locally(m.group(1))
+        return json.dumps({
+            "state": parsed.get("state") or "Goa",
+            "city": parsed.get("city") or "Panaji",
+            "days": parsed.get("days") or 3,
+            "budget": parsed.get("budget") or 10000,
+            "style": parsed.get("style") or "balanced",
+        })
+    if m := re.search(r"List 5 tourist places in ([^,\n]+)", prompt):
+        city = m.group(1).strip()
+        return json.dumps([{"name": f"{city} Highlight {i}", "city": city} for i in range(1, 6)])
+    if re.search(r"daily travel costs", prompt):
+        return json.dumps({"accommodation": 1500, "food": 800, "transport": 500, "activities": 1000})
+    if m := re.search(r"Create three (\d+)-day itineraries for ([^,\n]+)", prompt):
+        days, city = int(m.group(1)), m.group(2).strip()
+        return json.dumps({"plans": [itinerary(n, n.lower(), days, city) for n in ("Relaxed", "Balanced", "Packed")]})
+    if m := re.search(r"Create a detailed (\d+)-day itinerary for ([^,\n]+)", prompt):
+        days, city = int(m.group(1)), m.group(2).strip()
+        style = re.search(r'"name":\s*"(\w+)",\s*"style":\s*"(\w+)"', prompt)
+        name, style = style.groups() if style else ("Balanced", "balanced")
+        return json.dumps(itinerary(name, style, days, city))
+    if "travel summary" in prompt:
+        city = re.search(r"Destination: ([^,\n]+)", prompt)
+        days = re.search(r"Days: (\d+)", prompt)
+        plan = re.search(r"Selected Plan: (\w+) — Total Cost: ₹([\d,]+)", prompt)
+        return SUMMARY_TEMPLATE.format(city=city.group(1) if city else "your destination",
+                                       days=days.group(1) if days else "A few",
+                                       plan=plan.group(1) if plan else "Balanced",
+                                       cost=plan.group(2) if plan else "—")
+    return "OK"
+
+
+class StubLLM:
+    def __init__(self, config=None, seed=None):
+        self.config = merge_config(DEFAULT_CONFIG, config or {})
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "errors": 0, "streams": 0}
+        self._responses = [(re.compile(r["match"], re.S), r["text"]) for r in self.config["responses"]]
+
+    def answer(self, prompt):
+        for pattern, text in self._responses:
+            m = pattern.search(prompt)
+            if m:
+                return text.format(**m.groupdict())
+        return templated_answer(prompt)
+
+    def latency(self, provider, model):
+        latency = self.config["latency"]
+        return sample_latency(latency.get(f"{provider}:{model}") or latency.get(provider) or {}, self.rng)
+
+    def error_status(self, provider, model):
+        rates = self.config["error_rates"]
+        roll = self.rng.random()
+        for status, rate in (rates.get(f"{provider}:{model}") or rates.get(provider) or {}).items():
+            if roll < rate:
+                return int(status)
+            roll -= rate
+        return None
+
+    def chunks(self, text):
+        words = re.split(r"(?<=\s)", text)
+        size = self.config["stream_words"]
+        return ["".join(words[i:i + size]) for i in range(0, len(words), size)]
+
+
+class ChatHandler(tornado.web.RequestHandler):
+    def initialize(self, stub, provider):
+        self.stub = stub
+        self.provider = provider
+
+    async def post(self):
+        stub, provider = self.stub, self.provider
+        body = json.loads(self.request.body)
+        model = body.get("model", "")
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []) if isinstance(m.get("content"), str))
+        stub.stats["requests"] += 1
+
+        await asyncio.sleep(stub.latency(provider, model))
+        status = stub.error_status(provider, model)
+        if status:
+            stub.stats["errors"] += 1
+            self.set_status(status)
+            if status == 429:
+                self.set_header("Retry-After", str(stub.config["retry_after"]))
+            self.finish({"error": {"message": f"stub error {status}"}})
+            return
+
+        text = stub.answer(prompt)
+        if not body.get("stream"):
+            self.finish(self.completion(model, text))
+            return
+
+        stub.stats["streams"] += 1
+        self.set_header("Content-Type", "text/event-stream")
+        for chunk in stub.chunks(text):
+            self.write(self.stream_event(chunk))
+            await self.flush()
+            await asyncio.sleep(stub.config["stream_delay"])
+        self.finish(self.stream_end())
+
+    def completion(self, model, text):
+        if self.provider == "groq":
+            return {
+                "id": "stub", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            }
+        return {"id": "stub", "finish_reason": "COMPLETE",
+                "message": {"role": "assistant", "content": [{"type": "text", "text": text}]}}
+
+    def stream_event(self, text):
+        if self.provider == "groq":
+            return f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': text}}]})}\n\n"
+        event = {"type": "content-delta", "index": 0, "delta": {"message": {"content": {"text": text}}}}
+        return f"event: content-delta\ndata: {json.dumps(event)}\n\n"
+
+    def stream_end(self):
+        if self.provider == "groq":
+            return "data: [DONE]\n\n"
+        return f"event: message-end\ndata: {json.dumps({'type': 'message-end'})}\n\n"
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, stub):
+        self.stub = stub
+
+    def get(self):
+        self.finish(self.stub.stats)
+
+
+def make_app(stub):
+    return tornado.web.Application([
+        (r".*/chat/completions", ChatHandler, {"stub": stub, "provider": "groq"}),
+        (r".*/v2/chat", ChatHandler, {"stub": stub, "provider": "cohere"}),
+        (r"/stats", StatsHandler, {"stub": stub}),
+    ])
+
+
+def urls(port):
+    base = f"http://localhost:{port}"
+    return {"groq": f"{base}/openai/v1/chat/completions", "cohere": f"{base}/v2/chat"}
+
+
+def start_in_thread(port, config=None, seed=None):
+    # For benchmarks and tests: serves on a daemon thread, returns once listening
+    stub = StubLLM(config, seed)
+    ready = threading.Event()
+
+    async def serve():
+        make_app(stub).listen(port)
+        ready.set()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=asyncio.run, args=(serve(),), name="stub-llm", daemon=True).start()
+    if not ready.wait(10):
+        raise Exception(f"Stub LLM server did not start on port {port}")
+    return stub
+
+
+def load_config(path):
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Groq and Cohere chat APIs")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--config", help="JSON file overriding DEFAULT_CONFIG")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible latencies and errors")
+    args = parser.parse_args()
+
+    stub = StubLLM(load_config(args.config), args.seed)
+
+    async def serve():
+        make_app(stub).listen(args.port)
+        await asyncio.Event().wait()
+
+    for provider, url in urls(args.port).items():
+        print(f"{provider.upper()}_API_URL={url}")
+    started = time.time()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print(f"Served {stub.stats['requests']} requests in {time.time() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import bisect
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+# =============================
+# 🔭 TRACING, METRICS & LOGGING
+# =============================
+# Spans time each agent, pipeline stage and LLM call and carry attributes
+# (model, prompt/completion tokens, retries, where the answer came from).
+# Finished spans feed counters and histograms, rendered in the Prometheus
+# text format by render_prometheus(), and a ring buffer of recent spans,
+# exported as OpenTelemetry-compatible (OTLP/JSON) traces by export_spans().
+# With TRACING off (the default) span() hands back a shared no-op and
+# nothing is recorded. Console output goes through the "planner" loggers
+# (LOG_LEVEL, default WARNING); expensive messages are wrapped in lazy() so
+# they are only built when a handler will actually emit them.
+TRACING_ENABLED = os.getenv("TRACING", "0").lower() not in ("0", "false", "off", "no")
+MAX_SPANS = int(os.getenv("TRACING_MAX_SPANS", "2000"))
+SERVICE_NAME = "travel-planner"
+
+# Histogram bucket upper bounds in seconds
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Spans carrying these attributes are LLM calls and also feed the llm_* metrics
+LLM_LABELS = ("provider", "model")
+LLM_COUNTERS = {
+    "prompt_tokens": "llm_prompt_tokens_total",
+    "completion_tokens": "llm_completion_tokens_total",
+    "retries": "llm_retries_total",
+}
+
+# =============================
+# 📜 LOGGING
+# =============================
+_root_logger = logging.getLogger("planner")
+if not _root_logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _root_logger.addHandler(_handler)
+    _root_logger.setLevel(os.getenv("LOG_LEVEL", "WARNING").upper())
+    _root_logger.propagate = False
+
+
+def get_logger(name):
+    return logging.getLogger(f"planner.{name}")
+
+
+def set_log_level(level):
+    _root_logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+class lazy:
+    # log.debug("%s", lazy(json.dumps, plan, indent=2)) only serializes when the record is emitted
+    __slots__ = ("fn", "args", "kwargs")
+
+    def __init__(self, fn, *args, **kwargs):
+        self.fn, self.args, self.kwargs = fn, args, kwargs
+
+    def __str__(self):
+        return str(self.fn(*self.args, **self.kwargs))
+
+
+def preview(value, limit=800):
+    # Head of a JSON dump, for debug logs
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+# =============================
+# 📊 METRICS
+# =============================
+class Metrics:
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}    # name -> {labels: value}
+        self.histograms = {}  # name -> {labels: [bucket counts..., +Inf], sum, count}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            hist["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines += [f"{name}{_labels(key)} {_number(value)}" for key, value in series.items()]
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    running = 0
+                    for bound, count in zip(self.buckets + (float("inf"),), hist["buckets"]):
+                        running += count
+                        le = "+Inf" if bound == float("inf") else _number(bound)
+                        lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {running}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(hist['sum'])}")
+                    lines.append(f"{name}_count{_labels(key)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key):
+    if not key:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+
+def _number(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
+
+
+# =============================
+# 🧵 SPANS
+# =============================
+_current = ContextVar("planner_span", default=None)
+_finished = deque(maxlen=MAX_SPANS)
+
+
+class Span:
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "error",
+                 "_t0", "_activate", "_token")
+
+    def __init__(self, name, attrs, parent=None, activate=True):
+        if not isinstance(parent, Span):
+            parent = None  # e.g. NOOP_SPAN from before tracing was enabled
+        self.name = name
+        self.attrs = attrs
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._t0 = time.perf_counter()
+        self._activate = activate
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key, amount=1):
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def __enter__(self):
+        if self._activate:
+            self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        self.finish(exc)
+        return False
+
+    def finish(self, error=None):
+        # Spans used without `with` (e.g. across generator yields) are finished explicitly
+        if self.end_ns is not None:
+            return
+        elapsed = time.perf_counter() - self._t0
+        self.end_ns = self.start_ns + int(elapsed * 1e9)
+        self.error = (str(error) or type(error).__name__) if error is not None else None
+        _finished.append(self)
+        metrics.observe("span_duration_seconds", elapsed, span=self.name)
+        if self.error:
+            metrics.inc("span_errors_total", span=self.name)
+        if all(k in self.attrs for k in LLM_LABELS):
+            labels = {k: self.attrs[k] for k in LLM_LABELS}
+            metrics.inc("llm_requests_total", source=self.attrs.get("source", "provider"),
+                        outcome="error" if self.error else "ok", **labels)
+            metrics.observe("llm_request_seconds", elapsed, **labels)
+            for attr, name in LLM_COUNTERS.items():
+                if self.attrs.get(attr):
+                    metrics.inc(name, self.attrs[attr], **labels)
+
+
+class _NoopSpan:
+    # Shared stand-in while tracing is off: every operation does nothing
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+    def finish(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name, parent=None, activate=True, **attrs):
+    # `with span("agent.planner", mode=...) as s: ... s.set(tokens=...)`. Nested spans
+    # parent to the active one; activate=False for spans kept open across yields.
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return Span(name, attrs, parent or _current.get(), activate)
+
+
+def current_span():
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return _current.get() or NOOP_SPAN
+
+
+def traced(name):
+    # Decorator: runs the function inside span(name)
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACING_ENABLED:
+                return fn(*args, **kwargs)
+            with Span(name, {}, _current.get()):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def bind(fn, parent=None):
+    # Carries the active span (or `parent`) into work handed to another thread
+    if not TRACING_ENABLED:
+        return fn
+    parent = parent or _current.get()
+    if parent is None or parent is NOOP_SPAN:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def enable(on=True):
+    global TRACING_ENABLED
+    TRACING_ENABLED = on
+
+
+def reset():
+    _finished.clear()
+    metrics.reset()
+
+
+# =============================
+# 📤 EXPORTERS
+# =============================
+def render_prometheus():
+    return metrics.render_prometheus()
+
+
+def _otel_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otel_span(s):
+    data = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [{"key": k, "value": _otel_value(v)} for k, v in s.attrs.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        data["parentSpanId"] = s.parent_id
+    return data
+
+
+def export_spans(clear=False):
+    # Finished spans as an OTLP/JSON ExportTraceServiceRequest
+    spans = list(_finished)
+    if clear:
+        _finished.clear()
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "telemetry"}, "spans": [_otel_span(s) for s in spans]}],
+        }]
+    }
@@ -0,0 +1,55 @@
+import pytest
+
+from json_extract import REQUIRED, JSONExtractionError, extract_json_report, find_candidates
+
+QUERY = {"city": (str, REQUIRED), "days": (int, 0)}
+
+# (reply text, is_array, schema, expected value, expected repairs)
+CASES = [
+    ('{"city": "Goa", "days": 3}', False, QUERY, {"city": "Goa", "days": 3}, []),
+    ('<think>maybe {"city": "Pune"}?</think>\n{"city": "Goa", "days": 3}', False, QUERY,
+     {"city": "Goa", "days": 3}, []),
+    ('<think>never closed {"city": "Pune", "days": 1}', False, None, None, None),
+    ('```json\n{"city": "Goa", "days": 3}\n```', False, QUERY, {"city": "Goa", "days": 3}, []),
+    ('Draft: {"city": "Goa"} Final: {"city": "Goa", "days": 3}', False, QUERY, {"city": "Goa", "days": 3}, []),
+    ('[1, 2] then {"city": "Goa", "days": 3}', False, QUERY, {"city": "Goa", "days": 3}, []),
+    ('{"city": "Goa", "days": 3, "extra": [1, 2', False, QUERY,
+     {"city": "Goa", "days": 3, "extra": [1, 2]}, ["truncated"]),
+    ('[{"name": "Baga Beach"}, {"name": "Fort Agu', True, {"name": (str, REQUIRED)},
+     [{"name": "Baga Beach"}, {"name": "Fort Agu"}], ["truncated"]),
+    ("{'city': 'Goa', 'days': 3}", False, QUERY, {"city": "Goa", "days": 3}, ["single_quotes"]),
+    ("{'city': 'Goa', 'days': 3,}", False, QUERY, {"city": "Goa", "days": 3}, ["single_quotes", "trailing_comma"]),
+    ("Here's your plan: {\"city\": \"Goa\", \"days\": 3}", False, QUERY, {"city": "Goa", "days": 3}, []),
+    ("[Note: it's simple] {\"city\":\"Goa\",\"days\":3}", False, QUERY, {"city": "Goa", "days": 3}, []),
+    ('{"city": "Goa", "note": "it\'s sunny", "days": 3}', False, QUERY,
+     {"city": "Goa", "note": "it's sunny", "days": 3}, []),
+    ('{"city": "Goa", "days": "3 days"}', False, QUERY, {"city": "Goa", "days": 3}, []),
+    ('{"places": ["Baga Beach", "Fort Aguada"]}', True, {"name": (str, REQUIRED)},
+     [{"name": "Baga Beach"}, {"name": "Fort Aguada"}], []),
+]
+
+
+@pytest.mark.parametrize("text, is_array, schema, expected, repairs", CASES)
+def test_extract_json_report(text, is_array, schema, expected, repairs):
+    if expected is None:
+        with pytest.raises(JSONExtractionError):
+            extract_json_report(text, is_array=is_array, schema=schema)
+        return
+    value, report = extract_json_report(text, is_array=is_array, schema=schema)
+    assert value == expected
+    assert report["repairs"] == repairs
+
+
+@pytest.mark.parametrize("text, spans", [
+    ('a {"b": [1]} c [2]', [(2, 12, True), (15, 18, True)]),
+    ("[it's] {'a': 1}", [(0, 6, True), (7, 15, True)]),
+    ('x {"a": [1, ', [(2, 12, False)]),
+    ("no json here", []),
+])
+def test_find_candidates(text, spans):
+    assert list(find_candidates(text)) == spans
+
+
+def test_missing_required_field_raises():
+    with pytest.raises(JSONExtractionError):
+        extract_json_report('{"days": 3}', schema=QUERY)
@@ -0,0 +1,67 @@
+import pytest
+
+from query_parser import MIN_CONFIDENCE, comparison_intent, parse_locally, prefix_city
+
+PREFIX = "state Maharashtra city Mumbai "
+
+# (query, expected fields, whether the fast path may take it)
+PARSE_CASES = [
+    ("Mumbai 3 days budget 8000", {"city": "Mumbai", "state": "Maharashtra", "days": 3, "budget": 8000}, True),
+    ("Plan a 3-day trip to Jaipur under 15000, relaxed pace",
+     {"city": "Jaipur", "days": 3, "budget": 15000, "style": "relaxed"}, True),
+    ("Udaipur 5 days budget 1.5 lakh", {"city": "Udaipur", "days": 5, "budget": 150000}, True),
+    ("Mumbai weekend trip under 10000 rupees", {"city": "Mumbai", "days": 2, "budget": 10000}, True),
+    ("Manali for a week, max ₹20k", {"city": "Manali", "days": 7, "budget": 20000}, True),
+    (PREFIX + "Suggest me 4 days trip under 15000", {"city": "Mumbai", "days": 4, "budget": 15000}, True),
+    # A place the gazetteer doesn't know must not fall back to the sidebar city
+    (PREFIX + "Suggest a 3 day itinerary for Shillong under 20000", {"days": 3, "budget": 20000}, False),
+    # A number assigned to neither days nor budget
+    ("Agra 3 days 8000", {"city": "Agra", "days": 3}, False),
+    # No budget: the LLM fills it in
+    ("Plan a 5 day luxury trip to Mumbai", {"city": "Mumbai", "days": 5, "style": "luxury"}, False),
+    ("under 4 days in Udaipur", {"city": "Udaipur", "days": 4, "budget": 0}, False),
+    ("Mumbai to Goa 3 days budget 9000", {"days": 3, "budget": 9000}, False),
+    ("7 days Maharashtra tour budget 20000", {"state": "Maharashtra", "city": None, "days": 7}, False),
+]
+
+
+@pytest.mark.parametrize("query, expected, fast", PARSE_CASES)
+def test_parse_locally(query, expected, fast):
+    result, confidence = parse_locally(query)
+    assert {k: result[k] for k in expected} == expected
+    assert (confidence >= MIN_CONFIDENCE) is fast
+
+
+# (query, compare, near); compare None means the resolved city decides
+INTENT_CASES = [
+    # Sidebar examples, with the prefix the app adds when the query names neither the state nor the city
+    ("Mumbai 3 days budget 8000", False, False),
+    (PREFIX + "I want multiple trips under 5000 for 3 days", True, False),
+    ("Plan a 5 day luxury trip to Mumbai", False, False),
+    ("Weekend getaway near Mumbai under 10000", True, True),
+    ("7 days Maharashtra tour budget 20000", False, False),
+    (PREFIX + "Suggest me 4 days trip under 15000", None, False),
+    # Review cases
+    (PREFIX + "Suggest a 3 day itinerary for Shillong", None, False),
+    (PREFIX + "3 days under 5000", False, False),
+    (PREFIX + "several budget-friendly beach destinations", True, False),
+    ("Plan a 3 day trip to Goa from Mumbai", False, False),
+    ("Suggest a trip to Udaipur", False, False),
+    # A state, not a city: the resolver picks the destination
+    ("Suggest a trip to Goa", None, False),
+    ("Compare Goa and Manali", False, False),
+]
+
+
+@pytest.mark.parametrize("query, compare, near", INTENT_CASES)
+def test_comparison_intent(query, compare, near):
+    assert comparison_intent(query) == (compare, near)
+
+
+@pytest.mark.parametrize("query, city", [
+    (PREFIX + "3 days", "Mumbai"),
+    ("state Delhi city New Delhi weekend", "New Delhi"),
+    ("Mumbai 3 days", None),
+])
+def test_prefix_city(query, city):
+    assert prefix_city(query) == city
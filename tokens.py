@@ -0,0 +1,12 @@
+# =============================
+# 🔢 TOKEN ESTIMATION
+# =============================
+# Providers don't expose a tokenizer over HTTP, so budgets and benchmarks use
+# the usual ~4 characters per token approximation for English prompts.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)